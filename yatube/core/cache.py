@@ -0,0 +1,374 @@
+import atexit
+import fcntl
+import os
+import pickle
+import shutil
+import tempfile
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.cache.backends.locmem import LocMemCache
+
+from . import metrics
+
+_MISSING = object()
+# Ключ в журнале, означающий очистку всего кэша.
+CLEAR_ALL = '*'
+
+# Django создаёт свой объект кэша в каждом потоке, поэтому LRU
+# и позиция в журнале общие для всех объектов процесса с одним
+# каталогом, как словари у LocMemCache.
+_memories = {}
+_memories_lock = threading.Lock()
+_private_location = None
+
+
+class _Memory:
+    # Сколько последних записей ключей помнится для проверки в get.
+    WRITES_LIMIT = 10_000
+
+    def __init__(self, position):
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.position = position
+        # Номер последней записи, номера записей ключей и номер,
+        # до которого записи забыты: заполнение первого уровня из
+        # второго отменяется, если ключ меняли во время чтения.
+        self.seq = 0
+        self.writes = OrderedDict()
+        self.floor = 0
+
+
+def private_location():
+    """Временный каталог процесса для кэша с пустым LOCATION.
+    Воркеры и команды должны получать общий каталог в LOCATION."""
+    global _private_location
+    with _memories_lock:
+        if _private_location is None:
+            _private_location = tempfile.mkdtemp(prefix='yatube-cache-')
+            atexit.register(_remove_private, _private_location, os.getpid())
+        return _private_location
+
+
+def _remove_private(location, owner):
+    # Процесс, порождённый fork, наследует atexit родителя:
+    # каталог удаляет только создавший его процесс.
+    if os.getpid() == owner:
+        shutil.rmtree(location, ignore_errors=True)
+
+
+class MeteredCacheMixin:
+    """Считает попадания и промахи кэша по префиксу ключа.
+
+    get_many базового класса обходит ключи через get, поэтому
+    и пакетные чтения учитываются поштучно."""
+
+    def get(self, key, default=None, version=None):
+        value = super().get(key, _MISSING, version=version)
+        hit = value is not _MISSING
+        metrics.inc(
+            'yatube_cache_requests_total',
+            prefix=metrics.key_prefix(key),
+            result='hit' if hit else 'miss'
+        )
+        return value if hit else default
+
+
+class MeteredLocMemCache(MeteredCacheMixin, LocMemCache):
+    pass
+
+
+class SharedFileCache(FileBasedCache):
+    """Второй уровень: файловый кэш в каталоге, общем для всех воркеров.
+    Ключи приходят уже собранными первым уровнем."""
+
+    # Вытеснение обходит весь каталог, поэтому проверяется
+    # не на каждой записи, а раз в CULL_INTERVAL записей.
+    CULL_INTERVAL = 100
+
+    def __init__(self, location, params):
+        super().__init__(location, dict(
+            params, KEY_FUNCTION=lambda key, prefix, version: key))
+        self._writes = 0
+
+    def _cull(self):
+        self._writes += 1
+        if self._writes % self.CULL_INTERVAL == 1:
+            super()._cull()
+
+    def get_entry(self, key):
+        """(значение, момент истечения) или None, если ключа нет."""
+        try:
+            with open(self._key_to_file(key), 'rb') as file:
+                expiry = pickle.load(file)
+                if expiry is not None and expiry < time.time():
+                    file.close()
+                    self._delete(file.name)
+                    return None
+                return pickle.loads(zlib.decompress(file.read())), expiry
+        except FileNotFoundError:
+            return None
+
+
+class TwoTierCache(BaseCache):
+    """Кэш из двух уровней: небольшой LRU в памяти процесса перед
+    общим для воркеров файловым кэшем.
+
+    Каждая запись и удаление дописывают ключ в журнал в каталоге
+    второго уровня. Перед чтением процесс дочитывает журнал с места,
+    где остановился, и вытесняет из своего LRU ключи, изменённые
+    другими воркерами. Журнал длиннее JOURNAL_LIMIT байт заменяется
+    новым файлом: увидев другой inode, процессы очищают LRU целиком.
+
+    LOCATION — общий каталог; без него у процесса свой временный
+    каталог, и кэш ведёт себя как LocMemCache.
+
+    OPTIONS: L1_MAX_ENTRIES и L1_TIMEOUT ограничивают первый уровень,
+    MAX_ENTRIES и CULL_FREQUENCY передаются второму."""
+
+    JOURNAL_LIMIT = 1024 * 1024
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._l1_max_entries = int(options.get('L1_MAX_ENTRIES', 1000))
+        self._l1_timeout = float(options.get('L1_TIMEOUT', 60))
+        location = location or private_location()
+        os.makedirs(location, exist_ok=True)
+        self._l2 = SharedFileCache(location, {
+            'TIMEOUT': params.get('TIMEOUT', 300),
+            'OPTIONS': {
+                'MAX_ENTRIES': options.get('MAX_ENTRIES', 100_000),
+                'CULL_FREQUENCY': options.get('CULL_FREQUENCY', 3),
+            },
+        })
+        self._journal = os.path.join(location, 'invalidations.log')
+        self._journal_lock = threading.RLock()
+        self._lock_path = os.path.join(location, 'invalidations.lock')
+        self._lock_file = None
+        with _memories_lock:
+            memory = _memories.get(location)
+            if memory is None:
+                memory = _memories[location] = _Memory(
+                    self._journal_state())
+        self._memory = memory
+        self._l1 = memory.entries
+        self._l1_lock = memory.lock
+
+    # Первый уровень.
+
+    def _l1_get(self, key):
+        with self._l1_lock:
+            entry = self._l1.get(key)
+            if entry is None:
+                return None
+            pickled, expiry = entry
+            if expiry <= time.time():
+                del self._l1[key]
+                return None
+            self._l1.move_to_end(key)
+            return pickled
+
+    def _written(self, key):
+        """Отмечает запись ключа; вызывается под _l1_lock."""
+        memory = self._memory
+        memory.seq += 1
+        memory.writes[key] = memory.seq
+        memory.writes.move_to_end(key)
+        while len(memory.writes) > memory.WRITES_LIMIT:
+            _, seq = memory.writes.popitem(last=False)
+            memory.floor = seq
+
+    def _l1_put(self, key, pickled, expiry):
+        self._l1[key] = (pickled, expiry)
+        self._l1.move_to_end(key)
+        while len(self._l1) > self._l1_max_entries:
+            self._l1.popitem(last=False)
+
+    def _l1_expiry(self, expiry):
+        deadline = time.time() + self._l1_timeout
+        return deadline if expiry is None else min(expiry, deadline)
+
+    def _l1_set(self, key, value, expiry):
+        pickled = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        with self._l1_lock:
+            self._written(key)
+            self._l1_put(key, pickled, self._l1_expiry(expiry))
+
+    def _l1_fill(self, key, value, expiry, seq):
+        """Кладёт прочитанное со второго уровня значение, если с момента
+        seq, взятого до чтения, ключ не записывали: иначе старое значение
+        легло бы поверх нового, а свой pid журнал пропускает."""
+        pickled = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        with self._l1_lock:
+            memory = self._memory
+            if seq < memory.floor or memory.writes.get(key, 0) > seq:
+                return
+            self._l1_put(key, pickled, self._l1_expiry(expiry))
+
+    def _l1_delete(self, key):
+        with self._l1_lock:
+            self._written(key)
+            self._l1.pop(key, None)
+
+    def _l1_clear(self):
+        with self._l1_lock:
+            memory = self._memory
+            memory.seq += 1
+            memory.floor = memory.seq
+            memory.writes.clear()
+            self._l1.clear()
+
+    # Журнал инвалидаций.
+
+    def _journal_state(self):
+        try:
+            stat = os.stat(self._journal)
+        except FileNotFoundError:
+            return None, 0
+        return stat.st_ino, stat.st_size
+
+    def _sync(self):
+        """Вытесняет из LRU ключи, изменённые другими процессами."""
+        inode, size = self._journal_state()
+        known_inode, offset = self._memory.position
+        if inode == known_inode and size == offset:
+            return
+        if inode != known_inode or size < offset:
+            self._memory.position = (inode, size)
+            self._l1_clear()
+            return
+        with open(self._journal, 'rb') as file:
+            file.seek(offset)
+            data = file.read(size - offset)
+        complete = data.rfind(b'\n') + 1
+        self._memory.position = (inode, offset + complete)
+        # pid берётся заново: после fork воркеры наследуют объект кэша.
+        own = str(os.getpid()).encode()
+        for line in data[:complete].splitlines():
+            pid, key = line.split(b' ', 1)
+            if pid == own:
+                continue
+            if key == CLEAR_ALL.encode():
+                self._l1_clear()
+            else:
+                self._l1_delete(key.decode())
+
+    @contextmanager
+    def _exclusive(self):
+        """Блокировка журнала между потоками и процессами. Повторный
+        вход из того же потока не берёт flock второй раз: блокировка
+        через другой дескриптор того же файла ждала бы сама себя."""
+        with self._journal_lock:
+            if self._lock_file is not None:
+                yield
+                return
+            with open(self._lock_path, 'a') as lock:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                self._lock_file = lock
+                try:
+                    yield
+                finally:
+                    self._lock_file = None
+
+    def _publish(self, key):
+        key = key.replace('\n', ' ')
+        line = f'{os.getpid()} {key}\n'.encode()
+        with self._exclusive():
+            _, size = self._journal_state()
+            if size > self.JOURNAL_LIMIT:
+                descriptor, temporary = tempfile.mkstemp(
+                    dir=os.path.dirname(self._journal))
+                os.close(descriptor)
+                os.replace(temporary, self._journal)
+            descriptor = os.open(
+                self._journal, os.O_WRONLY | os.O_APPEND | os.O_CREAT)
+            try:
+                os.write(descriptor, line)
+            finally:
+                os.close(descriptor)
+
+    # API кэша Django.
+
+    def get(self, key, default=None, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        self._sync()
+        pickled = self._l1_get(key)
+        metrics.inc('yatube_cache_l1_requests_total',
+                    result='miss' if pickled is None else 'hit')
+        if pickled is not None:
+            return pickle.loads(pickled)
+        seq = self._memory.seq
+        entry = self._l2.get_entry(key)
+        if entry is None:
+            return default
+        value, expiry = entry
+        self._l1_fill(key, value, expiry, seq)
+        return value
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        self._l2.set(key, value, timeout)
+        self._l1_set(key, value, self.get_backend_timeout(timeout))
+        self._publish(key)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        with self._exclusive():
+            if not self._l2.add(key, value, timeout):
+                return False
+            self._l1_set(key, value, self.get_backend_timeout(timeout))
+            self._publish(key)
+        return True
+
+    def incr(self, key, delta=1, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        with self._exclusive():
+            entry = self._l2.get_entry(key)
+            if entry is None:
+                raise ValueError("Key '%s' not found" % key)
+            value = entry[0] + delta
+            self._l2.set(key, value, None if entry[1] is None
+                         else entry[1] - time.time())
+            self._l1_set(key, value, entry[1])
+            self._publish(key)
+        return value
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        touched = self._l2.touch(key, timeout)
+        self._l1_delete(key)
+        self._publish(key)
+        return touched
+
+    def delete(self, key, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        self._l2.delete(key)
+        self._l1_delete(key)
+        self._publish(key)
+
+    def has_key(self, key, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        self._sync()
+        return self._l1_get(key) is not None or self._l2.has_key(key)
+
+    def clear(self):
+        self._l2.clear()
+        self._l1_clear()
+        self._publish(CLEAR_ALL)
+
+
+class MeteredTwoTierCache(MeteredCacheMixin, TwoTierCache):
+    pass
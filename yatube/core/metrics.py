@@ -0,0 +1,165 @@
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+
+# Границы корзин гистограмм в секундах.
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+HELP = {
+    'yatube_request_duration_seconds': 'Время ответа по имени URL.',
+    'yatube_db_queries_total': 'Число SQL-запросов по имени URL.',
+    'yatube_db_query_seconds_total': 'Время SQL-запросов по имени URL.',
+    'yatube_cache_requests_total': 'Обращения к кэшу по префиксу ключа.',
+    'yatube_cache_l1_requests_total': 'Обращения к кэшу в памяти процесса.',
+    'yatube_cache_recomputations_total': 'Пересчёты значений кэша.',
+    'yatube_cache_recomputations_saved_total':
+        'Пересчёты, которых удалось избежать при промахе кэша.',
+    'yatube_thumbnail_seconds': 'Время генерации вариантов картинки.',
+}
+KEY_SEPARATORS = re.compile(r'[:|]')
+PAGE_KEY = 'views.decorators.cache.'
+
+_lock = threading.Lock()
+_counters = defaultdict(float)
+_histograms = {}
+_flushed_at = 0.0
+
+
+def _labels(labels):
+    return tuple(sorted(labels.items()))
+
+
+def inc(name, value=1, **labels):
+    """Увеличивает счётчик name с метками labels."""
+    with _lock:
+        _counters[name, _labels(labels)] += value
+
+
+def observe(name, value, **labels):
+    """Добавляет наблюдение в гистограмму name с метками labels."""
+    key = (name, _labels(labels))
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = [0] * len(BUCKETS) + [0, 0.0]
+        for index, bound in enumerate(BUCKETS):
+            if value <= bound:
+                histogram[index] += 1
+        histogram[-2] += 1
+        histogram[-1] += value
+
+
+def key_prefix(key):
+    """Префикс ключа кэша для метки: часть до первого «:» или «|»,
+    для ключей вида template.cache.post_card.<хэш> — без хэша,
+    а для страниц — вплоть до key_prefix из versioned_cache_page."""
+    prefix = KEY_SEPARATORS.split(str(key), 1)[0]
+    if prefix.startswith(PAGE_KEY):
+        return '.'.join(prefix.split('.')[:5])
+    if prefix == key and '.' in prefix:
+        prefix = prefix.rsplit('.', 1)[0]
+    return prefix
+
+
+def snapshot():
+    with _lock:
+        return {
+            'counters': [[name, labels, value]
+                         for (name, labels), value in _counters.items()],
+            'histograms': [[name, labels, list(values)]
+                           for (name, labels), values in _histograms.items()],
+        }
+
+
+def flush(force=False):
+    """Сохраняет метрики процесса в METRICS_DIR не чаще раза в
+    METRICS_FLUSH_INTERVAL секунд, чтобы /metrics любого воркера
+    видел сумму по всем процессам."""
+    global _flushed_at
+    directory = settings.METRICS_DIR
+    now = time.monotonic()
+    if not directory or (
+            not force and now - _flushed_at < settings.METRICS_FLUSH_INTERVAL):
+        return
+    _flushed_at = now
+    os.makedirs(directory, exist_ok=True)
+    descriptor, temporary = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    with os.fdopen(descriptor, 'w') as file:
+        json.dump(snapshot(), file)
+    os.replace(temporary, os.path.join(directory, f'{os.getpid()}.json'))
+
+
+def _snapshots():
+    directory = settings.METRICS_DIR
+    if not directory:
+        yield snapshot()
+        return
+    flush(force=True)
+    for name in os.listdir(directory):
+        if not name.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(directory, name)) as file:
+                yield json.load(file)
+        except (OSError, ValueError):
+            continue
+
+
+def collect():
+    """Метрики всех процессов: счётчики и корзины гистограмм суммируются.
+    Файлы завершившихся воркеров остаются, поэтому суммы не убывают."""
+    counters = defaultdict(float)
+    histograms = {}
+    for data in _snapshots():
+        for name, labels, value in data['counters']:
+            counters[name, tuple(map(tuple, labels))] += value
+        for name, labels, values in data['histograms']:
+            key = (name, tuple(map(tuple, labels)))
+            total = histograms.setdefault(key, [0] * len(values))
+            for index, value in enumerate(values):
+                total[index] += value
+    return counters, histograms
+
+
+def _format_labels(labels, **extra):
+    pairs = list(labels) + list(extra.items())
+    if not pairs:
+        return ''
+    escaped = (
+        '{}="{}"'.format(
+            name, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+        for name, value in pairs
+    )
+    return '{' + ','.join(escaped) + '}'
+
+
+def render():
+    """Метрики в текстовом формате Prometheus."""
+    counters, histograms = collect()
+    lines = []
+    described = set()
+
+    def describe(name, kind):
+        if name not in described:
+            described.add(name)
+            lines.append(f'# HELP {name} {HELP.get(name, name)}')
+            lines.append(f'# TYPE {name} {kind}')
+
+    for (name, labels), value in sorted(counters.items()):
+        describe(name, 'counter')
+        lines.append(f'{name}{_format_labels(labels)} {value}')
+    for (name, labels), values in sorted(histograms.items()):
+        describe(name, 'histogram')
+        for bound, count in zip(BUCKETS, values):
+            lines.append(
+                f'{name}_bucket{_format_labels(labels, le=bound)} {count}')
+        lines.append(
+            f'{name}_bucket{_format_labels(labels, le="+Inf")} {values[-2]}')
+        lines.append(f'{name}_sum{_format_labels(labels)} {values[-1]}')
+        lines.append(f'{name}_count{_format_labels(labels)} {values[-2]}')
+    return '\n'.join(lines) + '\n'
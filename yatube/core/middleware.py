@@ -0,0 +1,101 @@
+import time
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+
+from . import metrics, profiling, timing
+
+
+class QueryTimer:
+    """Обёртка execute_wrapper: число и суммарное время SQL-запросов."""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.seconds += time.perf_counter() - start
+
+
+def view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    return match.view_name if match else 'unresolved'
+
+
+class MetricsMiddleware:
+    """Собирает время ответа и SQL-запросы по имени URL для /metrics."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        queries = QueryTimer()
+        start = time.perf_counter()
+        with connection.execute_wrapper(queries):
+            response = self.get_response(request)
+        view = view_name(request)
+        metrics.observe(
+            'yatube_request_duration_seconds',
+            time.perf_counter() - start, view=view)
+        metrics.inc('yatube_db_queries_total', queries.count, view=view)
+        metrics.inc(
+            'yatube_db_query_seconds_total', queries.seconds, view=view)
+        metrics.flush()
+        return response
+
+
+class ServerTimingMiddleware:
+    """Заголовок Server-Timing с временем SQL, шаблонов и миниатюр.
+
+    Включается настройкой SERVER_TIMING. Шаблоны отмечают свои части
+    тегом {% timing %}: base.html — весь рендер (template), карточка
+    поста — posts_list; миниатюры замеряет тег card_image."""
+
+    def __init__(self, get_response):
+        if not settings.SERVER_TIMING:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        queries = QueryTimer()
+        token = timing.start()
+        start = time.perf_counter()
+        try:
+            with connection.execute_wrapper(queries):
+                response = self.get_response(request)
+        finally:
+            timings = timing.finish(token)
+        timings['db'] = (queries.seconds, queries.count)
+        timings['total'] = (time.perf_counter() - start, 1)
+        response['Server-Timing'] = timing.header(timings)
+        return response
+
+
+class ProfilingMiddleware:
+    """Снимает стеки выбранных запросов и сохраняет их в PROFILING_DIR
+    в свёрнутом формате для flamegraph. Какие запросы профилировать,
+    решает profiling.wanted."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        sampler = getattr(request, 'profiler', None)
+        if sampler is not None:
+            seconds = sampler.stop()
+            profiling.save(request.profiler_label, sampler.stacks, seconds)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        label = profiling.view_label(view_func)
+        if profiling.wanted(request, label):
+            request.profiler_label = label
+            request.profiler = profiling.StackSampler(
+                settings.PROFILING_INTERVAL)
@@ -0,0 +1,105 @@
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+from django.conf import settings
+
+SUFFIX = '.collapsed'
+
+
+def view_label(view_func):
+    """Имя вьюхи для каталога профилей: posts.views.index."""
+    return f'{view_func.__module__}.{view_func.__name__}'
+
+
+def wanted(request, label):
+    """Профилировать ли запрос: по имени URL или вьюхи из PROFILING_VIEWS,
+    по заголовку PROFILING_HEADER от сотрудника или с вероятностью
+    PROFILING_RATE."""
+    match = request.resolver_match
+    if {label, match.view_name} & set(settings.PROFILING_VIEWS):
+        return True
+    if settings.PROFILING_HEADER in request.META:
+        return request.user.is_staff
+    return random.random() < settings.PROFILING_RATE
+
+
+def collapse(frame):
+    """Стек кадра в формате flamegraph.pl: от корня к листу через «;»."""
+    names = []
+    while frame is not None:
+        module = frame.f_globals.get('__name__', '?')
+        names.append(f'{module}:{frame.f_code.co_name}')
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+class StackSampler:
+    """Раз в interval секунд снимает стек потока, обслуживающего
+    запрос, из отдельного потока. В отличие от cProfile не замедляет
+    сам запрос и сохраняет полные стеки, нужные для flamegraph."""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.stacks = Counter()
+        self.started = time.perf_counter()
+        self._thread_id = threading.get_ident()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name='profiler', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self._thread_id)
+            if frame is not None:
+                self.stacks[collapse(frame)] += 1
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+        return time.perf_counter() - self.started
+
+
+def save(label, stacks, seconds):
+    """Пишет профиль в PROFILING_DIR/<вьюха>/ и оставляет
+    не больше PROFILING_KEEP последних профилей вьюхи."""
+    directory = os.path.join(settings.PROFILING_DIR, label)
+    os.makedirs(directory, exist_ok=True)
+    name = (f'{datetime.now():%Y%m%d-%H%M%S-%f}-{os.getpid()}'
+            f'-{round(seconds * 1000)}ms{SUFFIX}')
+    with open(os.path.join(directory, name), 'w') as file:
+        for stack, count in stacks.most_common():
+            file.write(f'{stack} {count}\n')
+    for old in sorted(os.listdir(directory))[:-settings.PROFILING_KEEP]:
+        os.remove(os.path.join(directory, old))
+    return name
+
+
+def recent_profiles():
+    """Профили по вьюхам, от новых к старым: {вьюха: [(файл, мс)]}."""
+    root = settings.PROFILING_DIR
+    if not os.path.isdir(root):
+        return {}
+    profiles = {}
+    for label in sorted(os.listdir(root)):
+        names = sorted((name for name in os.listdir(
+            os.path.join(root, label)) if name.endswith(SUFFIX)),
+            reverse=True)
+        profiles[label] = [
+            (name, name[:-len(SUFFIX)].rsplit('-', 1)[1])
+            for name in names
+        ]
+    return profiles
+
+
+def profile_path(label, name):
+    """Путь к файлу профиля или None, если имя выходит за каталог."""
+    if os.path.basename(label) != label or os.path.basename(name) != name:
+        return None
+    path = os.path.join(settings.PROFILING_DIR, label, name)
+    return path if name.endswith(SUFFIX) and os.path.isfile(path) else None
@@ -0,0 +1,144 @@
+import math
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache as default_cache
+
+from . import metrics
+
+LOCK_SUFFIX = ':lock'
+# Как часто запрос без устаревшего значения проверяет, не готово ли
+# значение, которое пересчитывает другой процесс.
+POLL_INTERVAL = 0.05
+
+_flights = {}
+_flights_lock = threading.Lock()
+
+
+class _Flight:
+    """Пересчёт ключа, которого ждут другие потоки процесса."""
+
+    def __init__(self):
+        self.done = threading.Event()
+
+
+def _saved(key, reason):
+    metrics.inc('yatube_cache_recomputations_saved_total',
+                prefix=metrics.key_prefix(key), reason=reason)
+
+
+def _entry(cache, key):
+    """Запись (значение, поколение, свежа до, delta) или None; значения,
+    сохранённые в кэш в обход fetch, считаются отсутствующими."""
+    entry = cache.get(key)
+    if isinstance(entry, tuple) and len(entry) == 4:
+        return entry
+    return None
+
+
+def _fresh(entry, generation, now):
+    """Можно ли отдать запись без пересчёта.
+
+    За delta (сколько длился прошлый пересчёт) до истечения запись
+    с растущей вероятностью считается истёкшей (XFetch): один из
+    запросов обновит её заранее, и к сроку истечения лавины не будет."""
+    _, entry_generation, fresh_until, delta = entry
+    if entry_generation != generation:
+        return False
+    if fresh_until is None:
+        return True
+    early = delta * settings.STAMPEDE_BETA * -math.log(
+        1 - random.random())
+    return now + early < fresh_until
+
+
+def store(key, value, timeout, generation=None, delta=0.0, cache=None):
+    """Сохраняет значение вместе с поколением и сроком свежести.
+    Запись живёт на STAMPEDE_STALE_TIMEOUT дольше срока свежести,
+    чтобы её можно было отдать устаревшей во время пересчёта."""
+    cache = cache or default_cache
+    fresh_until = None if timeout is None else time.time() + timeout
+    hard_timeout = (None if timeout is None
+                    else timeout + settings.STAMPEDE_STALE_TIMEOUT)
+    cache.set(key, (value, generation, fresh_until, delta), hard_timeout)
+
+
+def _recompute(key, compute, timeout, generation, should_cache, cache,
+               trigger):
+    started = time.perf_counter()
+    value = compute()
+    delta = time.perf_counter() - started
+    metrics.inc('yatube_cache_recomputations_total',
+                prefix=metrics.key_prefix(key), trigger=trigger)
+    if should_cache is None or should_cache(value):
+        store(key, value, timeout, generation, delta, cache)
+    return value
+
+
+def _refresh(key, entry, compute, timeout, generation, should_cache, cache):
+    """Пересчёт под блокировкой в общем кэше: пересчитывает один
+    процесс, остальные отдают устаревшее значение или ждут нового."""
+    if entry is None:
+        trigger = 'miss'
+    elif entry[1] == generation and entry[2] is not None and (
+            entry[2] > time.time()):
+        trigger = 'early'
+    else:
+        trigger = 'stale'
+    lock = key + LOCK_SUFFIX
+    if cache.add(lock, 1, settings.STAMPEDE_LOCK_TIMEOUT):
+        try:
+            return _recompute(key, compute, timeout, generation,
+                              should_cache, cache, trigger)
+        finally:
+            cache.delete(lock)
+    if entry is not None:
+        _saved(key, 'stale')
+        return entry[0]
+    deadline = time.monotonic() + settings.STAMPEDE_WAIT
+    while time.monotonic() < deadline:
+        time.sleep(POLL_INTERVAL)
+        entry = _entry(cache, key)
+        if entry is not None and entry[1] == generation:
+            _saved(key, 'waited')
+            return entry[0]
+    return _recompute(key, compute, timeout, generation, should_cache,
+                      cache, trigger)
+
+
+def fetch(key, compute, timeout, generation=None, should_cache=None,
+          cache=None):
+    """Значение ключа из кэша или compute() с защитой от лавины
+    пересчётов.
+
+    Запись свежа, пока не истёк timeout и её поколение равно
+    generation. Одинаковые промахи внутри процесса сливаются в один
+    пересчёт: остальные потоки ждут его и читают результат из кэша,
+    получая свою копию значения (или устаревшее, если пересчитывает
+    другой процесс). should_cache(value) решает, сохранять
+    ли посчитанное значение."""
+    cache = cache or default_cache
+    entry = _entry(cache, key)
+    if entry is not None and _fresh(entry, generation, time.time()):
+        return entry[0]
+    with _flights_lock:
+        flight = _flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = _flights[key] = _Flight()
+    if not leader:
+        flight.done.wait(settings.STAMPEDE_LOCK_TIMEOUT)
+        entry = _entry(cache, key)
+        if entry is not None:
+            _saved(key, 'coalesced' if entry[1] == generation else 'stale')
+            return entry[0]
+        return compute()
+    try:
+        return _refresh(key, entry, compute, timeout, generation,
+                        should_cache, cache)
+    finally:
+        with _flights_lock:
+            del _flights[key]
+        flight.done.set()
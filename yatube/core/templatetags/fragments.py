@@ -0,0 +1,35 @@
+from django import template
+from django.core.cache import caches
+from django.core.cache.utils import make_template_fragment_key
+from django.templatetags import cache as django_cache
+
+from core import stampede
+
+register = template.Library()
+
+
+class StampedeCacheNode(django_cache.CacheNode):
+    """Фрагмент кэшируется через core.stampede: истёкший фрагмент
+    пересчитывает один запрос, остальные отдают прежний."""
+
+    def render(self, context):
+        expire_time = self.expire_time_var.resolve(context)
+        if expire_time is not None:
+            expire_time = int(expire_time)
+        name = (self.cache_name.resolve(context) if self.cache_name
+                else 'default')
+        key = make_template_fragment_key(
+            self.fragment_name,
+            [var.resolve(context) for var in self.vary_on])
+        return stampede.fetch(
+            key, lambda: self.nodelist.render(context), expire_time,
+            cache=caches[name])
+
+
+@register.tag
+def cache(parser, token):
+    """Тот же синтаксис, что у {% cache %} из {% load cache %}."""
+    node = django_cache.do_cache(parser, token)
+    return StampedeCacheNode(
+        node.nodelist, node.expire_time_var, node.fragment_name,
+        node.vary_on, node.cache_name)
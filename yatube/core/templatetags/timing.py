@@ -0,0 +1,28 @@
+from django import template
+
+from core.timing import timed
+
+register = template.Library()
+
+
+class TimingNode(template.Node):
+    def __init__(self, nodelist, name):
+        self.nodelist = nodelist
+        self.name = name
+
+    def render(self, context):
+        with timed(self.name.resolve(context)):
+            return self.nodelist.render(context)
+
+
+@register.tag
+def timing(parser, token):
+    """{% timing 'posts_list' %}...{% endtiming %} — время блока
+    попадает в заголовок Server-Timing под этим именем."""
+    bits = token.split_contents()
+    if len(bits) != 2:
+        raise template.TemplateSyntaxError(
+            f'{bits[0]} принимает одно имя замера.')
+    nodelist = parser.parse(('endtiming',))
+    parser.delete_first_token()
+    return TimingNode(nodelist, parser.compile_filter(bits[1]))
@@ -1,4 +1,5 @@
 from django import template
+from posts.utils import elided_page_range
 
 register = template.Library()
 
@@ -6,3 +7,20 @@ register = template.Library()
 @register.filter
 def addclass(field, css):
     return field.as_widget(attrs={'class': css})
+
+
+@register.simple_tag(takes_context=True)
+def url_replace(context, **kwargs):
+    """Строка запроса текущей страницы с новыми параметрами пагинации."""
+    query = context['request'].GET.copy()
+    for key in ('page', 'after', 'before'):
+        query.pop(key, None)
+    for key, value in kwargs.items():
+        query[key] = value
+    return query.urlencode()
+
+
+@register.simple_tag
+def page_range(page_obj):
+    """Номера страниц вокруг текущей, пропуски — None."""
+    return elided_page_range(page_obj.paginator, page_obj.number)
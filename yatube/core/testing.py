@@ -0,0 +1,27 @@
+"""Отдельный кэш для тестов: manage.py test (TEST_RUNNER) и pytest
+(плагин в pytest.ini) переводят кэши на временный каталог процесса,
+чтобы закэшированное не переживало тестовую базу."""
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+def isolated_caches():
+    # Без LOCATION core.cache берёт временный каталог процесса.
+    return {alias: dict(params, LOCATION=None)
+            for alias, params in settings.CACHES.items()}
+
+
+class IsolatedCacheRunner(DiscoverRunner):
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._caches = override_settings(CACHES=isolated_caches())
+        self._caches.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self._caches.disable()
+        super().teardown_test_environment(**kwargs)
+
+
+def pytest_configure(config):
+    override_settings(CACHES=isolated_caches()).enable()
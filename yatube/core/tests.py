@@ -0,0 +1,388 @@
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import Client, SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from posts.models import Post
+
+from . import metrics, stampede
+from .cache import TwoTierCache
+
+User = get_user_model()
+
+
+@override_settings(METRICS_ALLOWED_IPS=('127.0.0.1',))
+class MetricsTest(TestCase):
+    def setUp(self):
+        self.guest_client = Client()
+
+    def test_request_metrics(self):
+        '''Проверка метрик времени ответа, SQL и кэша по имени URL.'''
+        self.guest_client.get('/')
+        body = self.guest_client.get('/metrics').content.decode()
+        for sample in (
+            'yatube_request_duration_seconds_count{view="posts:main_page"}',
+            'yatube_request_duration_seconds_bucket'
+            '{view="posts:main_page",le="+Inf"}',
+            'yatube_db_queries_total{view="posts:main_page"}',
+            'yatube_db_query_seconds_total{view="posts:main_page"}',
+            'yatube_cache_requests_total{prefix="content_version",',
+        ):
+            with self.subTest(sample=sample):
+                self.assertIn(sample, body)
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_access(self):
+        '''Проверка, что /metrics закрыт для посторонних адресов.'''
+        remote = {'REMOTE_ADDR': '203.0.113.7'}
+        response = self.guest_client.get('/metrics', **remote)
+        self.assertEqual(response.status_code, 403)
+        response = self.guest_client.get(
+            '/metrics', HTTP_AUTHORIZATION='Bearer wrong', **remote)
+        self.assertEqual(response.status_code, 403)
+        response = self.guest_client.get(
+            '/metrics', HTTP_AUTHORIZATION='Bearer secret', **remote)
+        self.assertEqual(response.status_code, 200)
+
+    def test_sum_over_processes(self):
+        '''Проверка, что /metrics суммирует метрики всех воркеров.'''
+        labels = [['prefix', 'feed'], ['result', 'hit']]
+        with tempfile.TemporaryDirectory() as directory:
+            with open(os.path.join(directory, '1.json'), 'w') as file:
+                json.dump({
+                    'counters': [
+                        ['yatube_cache_requests_total', labels, 5]],
+                    'histograms': [],
+                }, file)
+            with override_settings(METRICS_DIR=directory):
+                metrics.inc(
+                    'yatube_cache_requests_total',
+                    prefix='feed', result='hit')
+                counters, histograms = metrics.collect()
+                self.assertTrue(os.path.exists(
+                    os.path.join(directory, f'{os.getpid()}.json')))
+        key = ('yatube_cache_requests_total', tuple(map(tuple, labels)))
+        own, _ = metrics.collect()
+        self.assertEqual(counters[key], own[key] + 5)
+
+    def test_key_prefix(self):
+        '''Проверка префиксов ключей кэша для меток.'''
+        prefixes = {
+            'feed:recent:3': 'feed',
+            'post_image:posts/cat.jpg': 'post_image',
+            'template.cache.post_card.0123abcd': 'template.cache.post_card',
+            'sorl-thumbnail||image||0123': 'sorl-thumbnail',
+            'content_version': 'content_version',
+            'views.decorators.cache.cache_page.index_page.GET.0123.4567':
+                'views.decorators.cache.cache_page.index_page',
+        }
+        for key, prefix in prefixes.items():
+            with self.subTest(key=key):
+                self.assertEqual(metrics.key_prefix(key), prefix)
+
+
+class ServerTimingTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='Noname')
+        for i in range(3):
+            Post.objects.create(text=f'Тестовый пост №{i}', author=cls.user)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_disabled_by_default(self):
+        '''Проверка, что без SERVER_TIMING заголовка нет.'''
+        response = Client().get('/')
+        self.assertFalse(response.has_header('Server-Timing'))
+
+    @override_settings(SERVER_TIMING=True)
+    def test_breakdown(self):
+        '''Проверка разбивки времени ответа в Server-Timing.'''
+        response = Client().get('/')
+        timings = {
+            entry.split(';')[0]: entry.split(';desc=')[1]
+            for entry in response['Server-Timing'].split(', ')
+        }
+        self.assertEqual(timings['posts_list'], '"3"')
+        self.assertEqual(timings['thumbnail'], '"3"')
+        self.assertEqual(timings['template'], '"1"')
+        self.assertIn('db', timings)
+        self.assertIn('total', timings)
+
+
+class ProfilingTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.directory = tempfile.TemporaryDirectory()
+        cls.settings = override_settings(
+            PROFILING_DIR=cls.directory.name, PROFILING_INTERVAL=0.001)
+        cls.settings.enable()
+        cls.staff = User.objects.create_user(username='Staff', is_staff=True)
+        cls.user = User.objects.create_user(username='Noname')
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.settings.disable()
+        cls.directory.cleanup()
+        super().tearDownClass()
+
+    def profiles(self, label):
+        directory = os.path.join(self.directory.name, label)
+        if not os.path.isdir(directory):
+            return []
+        return os.listdir(directory)
+
+    @override_settings(PROFILING_VIEWS=('posts:main_page',))
+    def test_profile_by_url_name(self):
+        '''Проверка, что запрос к выбранному URL профилируется.'''
+        Client().get('/')
+        Client().get('/about/tech/')
+        names = self.profiles('posts.views.index')
+        self.assertEqual(len(names), 1)
+        self.assertEqual(self.profiles('about.views.AboutTechView'), [])
+        with open(os.path.join(
+                self.directory.name, 'posts.views.index', names[0])) as file:
+            for line in file:
+                self.assertRegex(line, re.compile(r'^\S.*;\S+ \d+$'))
+
+    def test_profile_by_header_for_staff(self):
+        '''Проверка, что заголовок включает профилирование только
+        сотрудникам.'''
+        client = Client()
+        client.force_login(self.user)
+        client.get('/about/author/', HTTP_X_PROFILE='1')
+        self.assertEqual(self.profiles('about.views.AboutAuthorView'), [])
+        client.force_login(self.staff)
+        client.get('/about/author/', HTTP_X_PROFILE='1')
+        self.assertEqual(
+            len(self.profiles('about.views.AboutAuthorView')), 1)
+
+    @override_settings(PROFILING_RATE=1, PROFILING_KEEP=2)
+    def test_rate_and_admin_list(self):
+        '''Проверка выборки по доле, ротации и списка в админке.'''
+        for _ in range(3):
+            Client().get('/about/tech/')
+        names = self.profiles('about.views.AboutTechView')
+        self.assertEqual(len(names), 2)
+        client = Client()
+        client.force_login(self.staff)
+        response = client.get(reverse('profiles'))
+        self.assertContains(response, 'about.views.AboutTechView')
+        response = client.get(reverse(
+            'profile_file', args=('about.views.AboutTechView', names[0])))
+        self.assertEqual(response.status_code, 200)
+        response = client.get(reverse(
+            'profile_file', args=('about.views.AboutTechView', 'x.txt')))
+        self.assertEqual(response.status_code, 404)
+        response = Client().get(reverse('profiles'))
+        self.assertEqual(response.status_code, 302)
+
+
+class TwoTierCacheTest(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.location = directory.name
+
+    def worker(self, **options):
+        """Кэш отдельного процесса: со своим LRU в памяти."""
+        with mock.patch('core.cache._memories', {}):
+            return TwoTierCache(self.location, {'OPTIONS': options})
+
+    def test_cache_api(self):
+        '''Проверка чтения, записи, add, incr и удаления.'''
+        cache = self.worker()
+        cache.set('posts', [1, 2])
+        cache.get('posts').append(3)
+        self.assertEqual(cache.get('posts'), [1, 2])
+        self.assertFalse(cache.add('posts', []))
+        self.assertTrue(cache.add('version', 1))
+        self.assertEqual(cache.incr('version'), 2)
+        self.assertEqual(cache.get_many(['posts', 'version', 'missing']),
+                         {'posts': [1, 2], 'version': 2})
+        cache.delete('posts')
+        self.assertIsNone(cache.get('posts'))
+        with self.assertRaises(ValueError):
+            cache.incr('missing')
+
+    def test_shared_between_workers(self):
+        '''Проверка, что запись одного воркера видна другому,
+        а его копия в памяти вытесняется.'''
+        first, second = self.worker(), self.worker()
+        first.set('index_page', 'старая')
+        self.assertEqual(second.get('index_page'), 'старая')
+        with mock.patch('core.cache.os.getpid', return_value=1):
+            first.set('index_page', 'новая')
+            first.set('version', 1)
+        self.assertEqual(second.get('index_page'), 'новая')
+        self.assertEqual(second.get('version'), 1)
+        with mock.patch('core.cache.os.getpid', return_value=1):
+            first.clear()
+        self.assertIsNone(second.get('index_page'))
+
+    def test_shared_between_threads(self):
+        '''Проверка, что объекты кэша разных потоков процесса
+        видят записи друг друга.'''
+        first = TwoTierCache(self.location, {})
+        second = TwoTierCache(self.location, {})
+        first.set('page', 1)
+        self.assertEqual(second.get('page'), 1)
+        second.set('page', 2)
+        self.assertEqual(first.get('page'), 2)
+
+    def test_no_stale_fill_between_threads(self):
+        '''Проверка, что чтение со второго уровня не затирает в памяти
+        значение, записанное другим потоком во время чтения.'''
+        first = TwoTierCache(self.location, {})
+        second = TwoTierCache(self.location, {})
+        first.set('version', 1)
+        first._l1_delete(':1:version')
+        read = second._l2.get_entry
+
+        def racing_read(key):
+            entry = read(key)
+            first.set('version', 2)
+            return entry
+
+        with mock.patch.object(second._l2, 'get_entry', racing_read):
+            self.assertEqual(second.get('version'), 1)
+        self.assertEqual(second.get('version'), 2)
+
+    def test_bounded_memory_tier(self):
+        '''Проверка, что LRU в памяти ограничен, а вытесненные
+        ключи читаются со второго уровня.'''
+        cache = self.worker(L1_MAX_ENTRIES=2)
+        for key in ('a', 'b', 'c'):
+            cache.set(key, key)
+        cache.get('b')
+        cache.set('d', 'd')
+        self.assertEqual(list(cache._l1), [':1:b', ':1:d'])
+        self.assertEqual(cache.get('a'), 'a')
+
+    def test_journal_rotation(self):
+        '''Проверка, что после замены журнала память воркеров
+        очищается целиком.'''
+        first, second = self.worker(), self.worker()
+        first.set('page', 1)
+        second.get('page')
+        first.JOURNAL_LIMIT = 0
+        with mock.patch('core.cache.os.getpid', return_value=1):
+            first.set('other', 2)
+            first.set('page', 3)
+        self.assertEqual(second.get('page'), 3)
+
+
+class StampedeTest(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.calls = 0
+
+    def compute(self, value='новое'):
+        def compute():
+            self.calls += 1
+            time.sleep(0.05)
+            return value
+        return compute
+
+    def saved(self, reason):
+        counters, _ = metrics.collect()
+        return counters[(
+            'yatube_cache_recomputations_saved_total',
+            (('prefix', 'page'), ('reason', reason)))]
+
+    def test_fresh_value(self):
+        '''Проверка, что свежее значение не пересчитывается,
+        а смена поколения вызывает пересчёт.'''
+        self.assertEqual(stampede.fetch('page', self.compute(), 60, 1),
+                         'новое')
+        stampede.fetch('page', self.compute(), 60, 1)
+        self.assertEqual(self.calls, 1)
+        stampede.fetch('page', self.compute(), 60, 2)
+        self.assertEqual(self.calls, 2)
+
+    def test_stale_while_revalidate(self):
+        '''Проверка, что во время чужого пересчёта отдаётся
+        устаревшее значение.'''
+        stampede.store('page', 'старое', 60, generation=1)
+        cache.add('page' + stampede.LOCK_SUFFIX, 1)
+        saved = self.saved('stale')
+        self.assertEqual(stampede.fetch('page', self.compute(), 60, 2),
+                         'старое')
+        self.assertEqual(self.calls, 0)
+        self.assertEqual(self.saved('stale'), saved + 1)
+        cache.delete('page' + stampede.LOCK_SUFFIX)
+        self.assertEqual(stampede.fetch('page', self.compute(), 60, 2),
+                         'новое')
+
+    @override_settings(STAMPEDE_WAIT=1)
+    def test_wait_for_other_worker(self):
+        '''Проверка, что без устаревшего значения запрос ждёт
+        чужого пересчёта, а не считает сам.'''
+        cache.add('page' + stampede.LOCK_SUFFIX, 1)
+        timer = threading.Timer(
+            0.1, stampede.store, ('page', 'чужое', 60, 1))
+        timer.start()
+        self.assertEqual(stampede.fetch('page', self.compute(), 60, 1),
+                         'чужое')
+        timer.join()
+        self.assertEqual(self.calls, 0)
+
+    def test_single_flight(self):
+        '''Проверка, что одновременные промахи в процессе
+        сливаются в один пересчёт.'''
+        saved = self.saved('coalesced')
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(
+                stampede.fetch('page', self.compute([1]), 60)))
+            for _ in range(5)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, [[1]] * 5)
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(self.saved('coalesced'), saved + 4)
+
+    def test_early_refresh(self):
+        '''Проверка вероятностного обновления до истечения.'''
+        stampede.store('page', 'старое', 60, delta=1)
+        with override_settings(STAMPEDE_BETA=0):
+            self.assertEqual(stampede.fetch('page', self.compute(), 60),
+                             'старое')
+        with override_settings(STAMPEDE_BETA=10 ** 6):
+            self.assertEqual(stampede.fetch('page', self.compute(), 60),
+                             'новое')
+
+
+class NotFoundPageTest(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_cached_for_guests(self):
+        '''Проверка, что страница 404 для гостя отрисовывается один раз.'''
+        response = self.client.get('/missing/')
+        self.assertEqual(response.status_code, 404)
+        self.assertTemplateUsed(response, 'core/404.html')
+        response = self.client.get('/other/missing/')
+        self.assertEqual(response.status_code, 404)
+        self.assertTemplateNotUsed(response, 'core/404.html')
+        self.assertContains(response, 'Custom 404', status_code=404)
+
+    def test_not_cached_with_session(self):
+        '''Проверка, что 404 для пользователя с сессией не из кэша.'''
+        self.client.force_login(User.objects.create_user(username='Noname'))
+        self.client.get('/missing/')
+        response = self.client.get('/missing/')
+        self.assertTemplateUsed(response, 'core/404.html')
@@ -0,0 +1,46 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Замеры текущего запроса: имя -> (секунды, число замеров). None, пока
+# ServerTimingMiddleware выключен, и тогда замеры ничего не стоят.
+_timings = ContextVar('server_timings', default=None)
+
+
+def start():
+    return _timings.set({})
+
+
+def finish(token):
+    timings = _timings.get()
+    _timings.reset(token)
+    return timings
+
+
+def record(name, seconds, count=1):
+    timings = _timings.get()
+    if timings is not None:
+        spent, calls = timings.get(name, (0.0, 0))
+        timings[name] = (spent + seconds, calls + count)
+
+
+@contextmanager
+def timed(name):
+    """Добавляет время блока к замеру name текущего запроса."""
+    if _timings.get() is None:
+        yield
+        return
+    begin = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - begin)
+
+
+def header(timings):
+    """Значение заголовка Server-Timing: длительности в миллисекундах,
+    в описании — число замеров."""
+    return ', '.join(
+        f'{name};dur={seconds * 1000:.1f};desc="{count}"'
+        for name, (seconds, count) in timings.items()
+    )
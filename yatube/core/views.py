@@ -1,8 +1,25 @@
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.core.exceptions import PermissionDenied
+from django.http import FileResponse, Http404, HttpResponse
 from django.shortcuts import render
+from django.utils.crypto import constant_time_compare
+
+from . import metrics, profiling, stampede
+
+NOT_FOUND_KEY = 'page_not_found'
 
 
 def page_not_found(request, exception):
-    return render(request, 'core/404.html', status=404)
+    # Посетители без сессии видят одну и ту же страницу: её отрисовка
+    # кэшируется, чтобы перебор несуществующих адресов стоил дёшево.
+    if settings.SESSION_COOKIE_NAME in request.COOKIES:
+        return render(request, 'core/404.html', status=404)
+    content = stampede.fetch(
+        NOT_FOUND_KEY,
+        lambda: render(request, 'core/404.html').content,
+        settings.NOT_FOUND_CACHE_TIMEOUT)
+    return HttpResponse(content, status=404)
 
 
 def server_error(request):
@@ -15,3 +32,36 @@ def permission_denied(request, exception):
 
 def csrf_failure(request, reason=''):
     return render(request, 'core/403csrf.html')
+
+
+def _metrics_allowed(request):
+    if request.META.get('REMOTE_ADDR') in settings.METRICS_ALLOWED_IPS:
+        return True
+    token = settings.METRICS_TOKEN
+    header = request.META.get('HTTP_AUTHORIZATION', '')
+    return bool(token) and constant_time_compare(header, f'Bearer {token}')
+
+
+def prometheus_metrics(request):
+    # Метрики раскрывают имена URL, время SQL и префиксы ключей кэша:
+    # они доступны только сборщику с разрешённого адреса или с токеном.
+    if not _metrics_allowed(request):
+        raise PermissionDenied
+    return HttpResponse(
+        metrics.render(), content_type='text/plain; version=0.0.4')
+
+
+@staff_member_required
+def profiles(request):
+    return render(request, 'core/profiles.html', {
+        'profiles': profiling.recent_profiles(),
+    })
+
+
+@staff_member_required
+def profile_file(request, label, name):
+    path = profiling.profile_path(label, name)
+    if path is None:
+        raise Http404
+    return FileResponse(
+        open(path, 'rb'), content_type='text/plain; charset=utf-8')
@@ -0,0 +1,120 @@
+from django.core.files.storage import default_storage
+from django.db.models import F
+from django.http import JsonResponse
+
+from .comments import comment_batch
+from .models import Comment, Group, Post, User
+from .utils import KeysetPaginator
+from .views import COMMENT_COUNT, POST_COUNT
+
+# Поля постов и комментариев в ответах API. Строки берутся прямо
+# из .values(), без создания моделей.
+POST_VALUES = ('id', 'text', 'pub_date', 'image')
+POST_RELATED = {
+    'username': F('author__username'),
+    'group_slug': F('group__slug'),
+}
+COMMENT_VALUES = ('id', 'text', 'created')
+COMMENT_RELATED = {'username': F('author__username')}
+# Наибольшее число постов в одном пакетном запросе.
+BATCH_LIMIT = 100
+
+
+def post_rows(posts):
+    return posts.values(*POST_VALUES, **POST_RELATED)
+
+
+def image_urls(rows):
+    """Заменяет имена файлов картинок их адресами."""
+    for row in rows:
+        if row['image']:
+            row['image'] = default_storage.url(row['image'])
+        else:
+            row['image'] = None
+    return rows
+
+
+def not_found():
+    return JsonResponse({'detail': 'Не найдено.'}, status=404)
+
+
+def post_list(request, posts):
+    """Страница постов по курсору ?after= / ?before=."""
+    feed = KeysetPaginator(post_rows(posts), POST_COUNT)
+    page_obj = feed.get_page(
+        request.GET.get('after'), request.GET.get('before'))
+    return JsonResponse({
+        'results': image_urls(page_obj.object_list),
+        'next': feed.next_cursor,
+        'previous': feed.previous_cursor,
+    })
+
+
+def index(request):
+    return post_list(request, Post.objects.all())
+
+
+def group_posts(request, slug):
+    group_id = Group.objects.filter(
+        slug=slug).values_list('id', flat=True).first()
+    if group_id is None:
+        return not_found()
+    return post_list(request, Post.objects.filter(group_id=group_id))
+
+
+def profile(request, username):
+    author_id = User.objects.filter(
+        username=username).values_list('id', flat=True).first()
+    if author_id is None:
+        return not_found()
+    return post_list(request, Post.objects.filter(author_id=author_id))
+
+
+def comment_page(request, post_id):
+    comments, next_cursor = comment_batch(
+        Comment.objects.filter(post_id=post_id).values(
+            *COMMENT_VALUES, **COMMENT_RELATED),
+        COMMENT_COUNT, request.GET.get('after'))
+    return {'results': comments, 'next': next_cursor}
+
+
+def post_detail(request, post_id):
+    """Пост и первая пачка его комментариев с курсором следующей."""
+    post = post_rows(Post.objects.filter(pk=post_id)).first()
+    if post is None:
+        return not_found()
+    image_urls([post])
+    return JsonResponse({
+        'post': post,
+        'comments': comment_page(request, post_id),
+    })
+
+
+def post_comments(request, post_id):
+    """Следующая пачка комментариев поста по курсору ?after=."""
+    if not Post.objects.filter(pk=post_id).exists():
+        return not_found()
+    return JsonResponse(comment_page(request, post_id))
+
+
+def posts_batch(request):
+    """Несколько постов за один запрос: ?ids=1,2,3.
+
+    Посты возвращаются в порядке ids, отсутствующие перечислены
+    в missing."""
+    try:
+        ids = [int(pk) for pk in request.GET.get('ids', '').split(',') if pk]
+        ids = list(dict.fromkeys(ids))
+    except ValueError:
+        return JsonResponse(
+            {'detail': 'ids — список чисел через запятую.'}, status=400)
+    if len(ids) > BATCH_LIMIT:
+        return JsonResponse(
+            {'detail': f'Не больше {BATCH_LIMIT} постов за раз.'},
+            status=400)
+    rows = {row['id']: row
+            for row in post_rows(Post.objects.filter(pk__in=ids))}
+    return JsonResponse({
+        'results': image_urls([rows[pk] for pk in ids if pk in rows]),
+        'missing': [pk for pk in ids if pk not in rows],
+    })
@@ -0,0 +1,216 @@
+import math
+import random
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.cookiejar import CookieJar
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlencode
+from urllib.request import HTTPCookieProcessor, Request, build_opener
+
+from django.conf import settings
+from django.db.models import Max, Min
+from django.urls import reverse
+
+from .models import Group, Post, User, UserStats
+from .seeding import PASSWORD, PREFIX
+
+# Сколько разных объектов каждого вида перебирают клиенты.
+SAMPLE_SIZE = 200
+METRIC_LINE = re.compile(r'^(\w+)\{view="([^"]+)"\} (\S+)$')
+
+
+def _sample(queryset, field):
+    """Случайные значения field по случайным id, без ORDER BY RANDOM()."""
+    bounds = queryset.aggregate(low=Min('id'), high=Max('id'))
+    low, high = bounds['low'], bounds['high']
+    if low is None:
+        return []
+    candidates = random.sample(
+        range(low, high + 1), min(SAMPLE_SIZE, high - low + 1))
+    return list(queryset.filter(id__in=candidates).values_list(
+        field, flat=True))
+
+
+def targets():
+    """Проверяемые страницы: (имя URL, нужен ли вход, функция пути)."""
+    posts = _sample(Post.objects, 'id')
+    slugs = _sample(Group.objects, 'slug')
+    names = _sample(User.objects, 'username')
+
+    def pick(name, values):
+        return lambda: reverse(name, args=(random.choice(values),))
+
+    return [
+        ('posts:main_page', False, lambda: reverse('posts:main_page')),
+        ('posts:group_list', False, pick('posts:group_list', slugs)),
+        ('posts:profile', False, pick('posts:profile', names)),
+        ('posts:post_detail', False, pick('posts:post_detail', posts)),
+        ('posts:search', False, lambda: '{}?{}'.format(
+            reverse('posts:search'), urlencode({'q': 'сгенерированный'}))),
+        ('posts:api_index', False, lambda: reverse('posts:api_index')),
+        ('posts:api_post_detail', False,
+         pick('posts:api_post_detail', posts)),
+        ('posts:api_posts_batch', False, lambda: '{}?ids={}'.format(
+            reverse('posts:api_posts_batch'),
+            ','.join(map(str, random.sample(posts, min(20, len(posts))))))),
+        ('about:author', False, lambda: reverse('about:author')),
+        ('posts:follow_index', True, lambda: reverse('posts:follow_index')),
+        ('posts:create_post', True, lambda: reverse('posts:create_post')),
+    ]
+
+
+class Session:
+    """HTTP-клиент с cookie: один на поток нагрузки."""
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+        self.cookies = CookieJar()
+        self.opener = build_opener(HTTPCookieProcessor(self.cookies))
+
+    def get(self, path):
+        try:
+            with self.opener.open(self.base_url + path, timeout=60) as reply:
+                reply.read()
+                return reply.status
+        except HTTPError as error:
+            return error.code
+
+    def login(self, username, password):
+        login = reverse('users:login')
+        self.get(login)
+        token = next(
+            cookie.value for cookie in self.cookies
+            if cookie.name == 'csrftoken')
+        data = urlencode({
+            'username': username,
+            'password': password,
+            'csrfmiddlewaretoken': token,
+        }).encode()
+        self.opener.open(self.base_url + login, data, timeout=60).read()
+        if not any(cookie.name == settings.SESSION_COOKIE_NAME
+                   for cookie in self.cookies):
+            raise ValueError(f'Не удалось войти как {username}.')
+
+
+def query_counts(base_url):
+    """Число запросов и SQL-запросов по вьюхам из /metrics
+    или None, если метрики недоступны (в том числе без METRICS_TOKEN)."""
+    request = Request(f'{base_url}/metrics')
+    if settings.METRICS_TOKEN:
+        request.add_header('Authorization', f'Bearer {settings.METRICS_TOKEN}')
+    try:
+        with build_opener().open(request, timeout=60) as reply:
+            text = reply.read().decode()
+    except (HTTPError, URLError):
+        return None
+    counts = {}
+    for line in text.splitlines():
+        match = METRIC_LINE.match(line)
+        if match and match.group(1) in (
+                'yatube_db_queries_total',
+                'yatube_request_duration_seconds_count'):
+            counts[match.group(1), match.group(2)] = float(match.group(3))
+    return counts
+
+
+def _percentile(ordered, share):
+    """Перцентиль по ближайшему рангу из отсортированного списка."""
+    if not ordered:
+        return 0
+    rank = max(math.ceil(share / 100 * len(ordered)), 1)
+    return ordered[rank - 1]
+
+
+def summarize(latencies, errors, seconds):
+    """Перцентили задержки в миллисекундах и пропускная способность."""
+    latencies = sorted(latency * 1000 for latency in latencies)
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'p50': round(_percentile(latencies, 50), 2),
+        'p95': round(_percentile(latencies, 95), 2),
+        'p99': round(_percentile(latencies, 99), 2),
+        'rps': round(len(latencies) / seconds, 2),
+    }
+
+
+def run_target(path, sessions, requests):
+    """Прогоняет requests запросов, поровну на каждую сессию-клиента."""
+    def client(session, count):
+        timings = []
+        for _ in range(count):
+            start = time.perf_counter()
+            status = session.get(path())
+            timings.append((time.perf_counter() - start, status))
+        return timings
+
+    shares = [requests // len(sessions)] * len(sessions)
+    shares[0] += requests % len(sessions)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(len(sessions)) as pool:
+        timings = [
+            timing for part in pool.map(client, sessions, shares)
+            for timing in part
+        ]
+    seconds = time.perf_counter() - start
+    errors = sum(status >= 400 for _, status in timings)
+    return summarize([latency for latency, _ in timings], errors, seconds)
+
+
+def run(base_url, requests, concurrency, only=None):
+    """Нагружает каждую страницу concurrency клиентами и возвращает
+    сводку по ней, включая среднее число SQL-запросов на ответ."""
+    base_url = base_url.rstrip('/')
+    reader = UserStats.objects.filter(
+        following_count__gt=0, user__username__startswith=f'{PREFIX}_'
+    ).select_related('user').first()
+    results = {}
+    for name, auth, path in targets():
+        if only and name not in only:
+            continue
+        if auth and reader is None:
+            continue
+        sessions = [Session(base_url) for _ in range(concurrency)]
+        if auth:
+            for session in sessions:
+                session.login(reader.user.username, PASSWORD)
+        before = query_counts(base_url)
+        results[name] = run_target(path, sessions, requests)
+        after = query_counts(base_url)
+        results[name]['queries'] = None
+        if before is not None and after is not None:
+            served = (after.get(('yatube_request_duration_seconds_count',
+                                 name), 0)
+                      - before.get(('yatube_request_duration_seconds_count',
+                                    name), 0))
+            queries = (after.get(('yatube_db_queries_total', name), 0)
+                       - before.get(('yatube_db_queries_total', name), 0))
+            if served:
+                results[name]['queries'] = round(queries / served, 2)
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Регрессии относительно baseline: рост p95 или падение пропускной
+    способности больше чем на tolerance, рост числа SQL-запросов
+    или появление ошибок."""
+    regressions = []
+    for name, current in sorted(results.items()):
+        old = baseline.get(name)
+        if old is None:
+            continue
+        if current['p95'] > old['p95'] * (1 + tolerance):
+            regressions.append(
+                f"{name}: p95 {old['p95']} -> {current['p95']} мс")
+        if current['rps'] < old['rps'] * (1 - tolerance):
+            regressions.append(
+                f"{name}: rps {old['rps']} -> {current['rps']}")
+        if (current['queries'] or 0) > (old['queries'] or 0):
+            regressions.append(
+                f"{name}: SQL-запросов {old['queries']} -> "
+                f"{current['queries']}")
+        if current['errors'] > old['errors']:
+            regressions.append(
+                f"{name}: ошибок {old['errors']} -> {current['errors']}")
+    return regressions
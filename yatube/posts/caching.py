@@ -0,0 +1,164 @@
+import hashlib
+import time
+from datetime import datetime, timezone
+from functools import wraps
+
+from core import stampede
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.cache import (get_cache_key, has_vary_header,
+                                learn_cache_key, patch_cache_control,
+                                patch_vary_headers)
+from django.views.decorators.http import condition
+
+CONTENT_VERSION_KEY = 'content_version'
+CONTENT_CHANGED_KEY = 'content_changed_at'
+
+
+def content_version():
+    """Текущее поколение контента сайта.
+
+    Если ключ вытеснен из кэша, поколение начинается заново с текущего
+    времени в миллисекундах, чтобы не совпасть ни с одним прежним.
+    """
+    version = cache.get(CONTENT_VERSION_KEY)
+    if version is None:
+        cache.add(CONTENT_VERSION_KEY, int(time.time() * 1000), None)
+        version = cache.get(CONTENT_VERSION_KEY)
+    return version
+
+
+def bump_content_version():
+    """Делает недействительными все страницы, закэшированные ранее."""
+    try:
+        cache.incr(CONTENT_VERSION_KEY)
+    except ValueError:
+        content_version()
+    cache.set(CONTENT_CHANGED_KEY, time.time(), None)
+
+
+def content_changed_at():
+    """Время последнего изменения контента с точностью до секунды.
+
+    Пока эта секунда не прошла, возвращает None: следующая запись в ту же
+    секунду не сдвинула бы Last-Modified, и клиент с If-Modified-Since
+    получил бы 304 на устаревшую страницу."""
+    changed_at = cache.get(CONTENT_CHANGED_KEY)
+    if changed_at is None:
+        cache.add(CONTENT_CHANGED_KEY, time.time(), None)
+        changed_at = cache.get(CONTENT_CHANGED_KEY)
+    if int(changed_at) >= int(time.time()):
+        return None
+    return datetime.fromtimestamp(int(changed_at), timezone.utc)
+
+
+def _cacheable(request, response):
+    """Те же правила, что у UpdateCacheMiddleware: только обычные
+    ответы 200 без Cache-Control: private и без новых cookie
+    для посетителя, у которого их не было."""
+    if response.streaming or response.status_code != 200:
+        return False
+    if 'private' in response.get('Cache-Control', ()):
+        return False
+    return not (not request.COOKIES and response.cookies
+                and has_vary_header(response, 'Cookie'))
+
+
+def _revalidate(response):
+    """Страница хранится на сервере до PAGE_CACHE_TIMEOUT, а браузер
+    и прокси сверяются с сервером на каждом запросе по ETag
+    и Last-Modified: иначе они показывали бы её часами после изменения
+    контента. Страница зависит от cookie, поэтому она ещё и private."""
+    patch_cache_control(response, no_cache=True, max_age=0)
+    if has_vary_header(response, 'Cookie'):
+        patch_cache_control(response, private=True)
+    return response
+
+
+def versioned_cache_page(key_prefix, timeout=None):
+    """Как cache_page, но страница живёт до первого изменения постов,
+    групп, комментариев или подписок, а не до истечения короткого
+    таймаута: в записи хранится поколение контента.
+
+    Ключ от поколения не зависит, поэтому после изменения контента
+    страницу пересчитывает один запрос, а одновременные с ним получают
+    прежнюю версию (core.stampede), а не строят её все сразу.
+    Шапка страницы зависит от пользователя, поэтому ключ зависит
+    и от cookie (Vary: Cookie), как с vary_on_cookie."""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(request, *args, **kwargs)
+            page_timeout = (settings.PAGE_CACHE_TIMEOUT
+                            if timeout is None else timeout)
+            version = content_version()
+
+            def compute():
+                response = view(request, *args, **kwargs)
+                patch_vary_headers(response, ('Cookie',))
+                response.content_version = version
+                return response
+
+            def should_cache(response):
+                return _cacheable(request, response)
+
+            key = get_cache_key(request, key_prefix, 'GET', cache=cache)
+            if key is not None:
+                response = stampede.fetch(
+                    key, compute, page_timeout, version, should_cache)
+            else:
+                # Список заголовков Vary ещё не известен: ключ страницы
+                # появится только после первого ответа.
+                response = compute()
+                if should_cache(response):
+                    key = learn_cache_key(request, response, page_timeout,
+                                          key_prefix, cache=cache)
+                    stampede.store(key, response, page_timeout, version)
+            # Пока страницу пересчитывает другой запрос, отдаётся
+            # прежнее поколение: conditional_page не подпишет его
+            # валидаторами текущего.
+            response.stale_content = getattr(
+                response, 'content_version', version) != version
+            if should_cache(response):
+                _revalidate(response)
+            return response
+        return wrapper
+    return decorator
+
+
+def conditional_page(key_prefix):
+    """Отвечает 304 Not Modified, пока не сменилось поколение контента,
+    ещё до кэша страниц, запросов к базе и шаблонов.
+
+    Шапка страницы зависит от пользователя, поэтому ETag включает хэш
+    сессионной cookie, а Last-Modified отдаётся только посетителям
+    без сессии: одного If-Modified-Since им достаточно. ETag включает
+    и адрес, чтобы валидатор одной страницы не подходил к другой.
+    Устаревшая страница из versioned_cache_page уходит без валидаторов,
+    иначе клиент сохранил бы её под ETag нового поколения.
+    """
+    def etag(request, *args, **kwargs):
+        session = request.COOKIES.get(settings.SESSION_COOKIE_NAME, '')
+        raw = (f'{key_prefix}:{request.get_full_path()}:'
+               f'{content_version()}:{session}')
+        return hashlib.md5(raw.encode()).hexdigest()
+
+    def last_modified(request, *args, **kwargs):
+        if settings.SESSION_COOKIE_NAME in request.COOKIES:
+            return None
+        return content_changed_at()
+
+    def decorator(view):
+        conditional = condition(
+            etag_func=etag, last_modified_func=last_modified)(view)
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            response = conditional(request, *args, **kwargs)
+            if getattr(response, 'stale_content', False):
+                del response['ETag']
+                del response['Last-Modified']
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,26 @@
+from django.db.models import Q
+
+from .utils import decode_cursor, encode_cursor, row_value
+
+
+def comment_batch(comments, per_page, after=None):
+    """Очередная пачка комментариев поста от старых к новым.
+
+    comments — комментарии одного поста: модели с select_related
+    автора или строки .values(). Позиция — курсор (created, id)
+    последнего показанного комментария, поэтому пачка берётся по индексу
+    (post, created) без OFFSET. Возвращает комментарии и курсор
+    следующей пачки, если она есть.
+    """
+    cursor = decode_cursor(after)
+    if cursor is not None:
+        created, pk = cursor
+        comments = comments.filter(
+            Q(created__gt=created) | Q(created=created, id__gt=pk))
+    rows = list(comments.order_by('created', 'id')[:per_page + 1])
+    next_cursor = None
+    if len(rows) > per_page:
+        rows = rows[:per_page]
+        next_cursor = encode_cursor(
+            row_value(rows[-1], 'created'), row_value(rows[-1], 'id'))
+    return rows, next_cursor
@@ -0,0 +1,116 @@
+from core import stampede
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from .models import Comment, Follow, Group, Post, User, UserStats
+from .objects import forget
+
+USER_COUNTERS = {
+    'posts_count': (Post, 'author'),
+    'comments_count': (Comment, 'author'),
+    'followers_count': (Follow, 'author'),
+    'following_count': (Follow, 'user'),
+}
+
+
+def bump_user(user_id, **deltas):
+    """Атомарно сдвигает счётчики: bump_user(user_id, posts_count=1)."""
+    if user_id is None:
+        return
+    # Уменьшение не уводит счётчик ниже нуля, даже если он разошёлся
+    # с данными: такой дрейф исправляет команда recount_stats.
+    floors = {f'{field}__gte': -delta
+              for field, delta in deltas.items() if delta < 0}
+    UserStats.objects.filter(user_id=user_id, **floors).update(
+        **{field: F(field) + delta for field, delta in deltas.items()}
+    )
+    # Счётчики хранятся в кэше вместе с пользователем.
+    forget('user', user_id)
+
+
+def bump_group(group_id, delta):
+    if group_id is None:
+        return
+    Group.objects.filter(pk=group_id, posts_count__gte=-delta).update(
+        posts_count=F('posts_count') + delta
+    )
+    forget('group', group_id)
+
+
+def _count_of(model, field):
+    """Подзапрос числа строк model, ссылающихся на внешний объект."""
+    rows = model.objects.filter(**{field: OuterRef('pk')}).order_by()
+    return Coalesce(Subquery(
+        rows.values(field).annotate(total=Count('pk')).values('total'),
+        output_field=IntegerField()
+    ), 0)
+
+
+def recount_users():
+    """Пересчитывает счётчики всех пользователей по данным таблиц.
+    Возвращает число созданных и исправленных строк статистики."""
+    users = User.objects.annotate(**{
+        f'real_{field}': _count_of(model, lookup)
+        for field, (model, lookup) in USER_COUNTERS.items()
+    })
+    stats = UserStats.objects.in_bulk()
+    created, drifted = [], []
+    for user in users.iterator():
+        real = {field: getattr(user, f'real_{field}')
+                for field in USER_COUNTERS}
+        row = stats.get(user.pk)
+        if row is None:
+            created.append(UserStats(user=user, **real))
+        elif any(getattr(row, field) != value
+                 for field, value in real.items()):
+            for field, value in real.items():
+                setattr(row, field, value)
+            drifted.append(row)
+    UserStats.objects.bulk_create(created)
+    UserStats.objects.bulk_update(drifted, USER_COUNTERS, batch_size=1000)
+    # bulk_update не шлёт сигналов: кэш объектов сбрасывается здесь.
+    forget('user', *(row.user_id for row in created + drifted))
+    return len(created) + len(drifted)
+
+
+def recount_groups():
+    """Пересчитывает счётчик постов групп, возвращает число исправленных."""
+    groups = Group.objects.annotate(real=_count_of(Post, 'group')).exclude(
+        posts_count=F('real'))
+    drifted = []
+    for group in groups.iterator():
+        group.posts_count = group.real
+        drifted.append(group)
+    Group.objects.bulk_update(drifted, ['posts_count'], batch_size=1000)
+    forget('group', *(group.pk for group in drifted))
+    return len(drifted)
+
+
+# Число постов для нумерованной пагинации по областям: 'all',
+# 'group:<id>', 'author:<id>' и 'feed:<id подписчика>'.
+
+def count_key(scope):
+    return f'post_count:{scope}'
+
+
+def cached_count(scope, queryset):
+    """Функция, возвращающая число строк queryset из кэша области.
+
+    Счётчик ленты сбрасывается при постах авторов подписки, но сбросы
+    идут по всем подписчикам, поэтому он ещё и живёт недолго."""
+    timeout = (settings.FEED_COUNT_TIMEOUT if scope.startswith('feed:')
+               else settings.POST_COUNT_TIMEOUT)
+    return lambda: stampede.fetch(count_key(scope), queryset.count, timeout)
+
+
+def forget_counts(*scopes):
+    cache.delete_many([count_key(scope) for scope in scopes])
+
+
+def forget_post_counts(author_id, *group_ids):
+    """Сбрасывает счётчики областей, в которые входит пост."""
+    forget_counts('all', f'author:{author_id}', *(
+        f'group:{group_id}' for group_id in group_ids
+        if group_id is not None))
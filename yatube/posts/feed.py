@@ -0,0 +1,249 @@
+import heapq
+from itertools import dropwhile, islice, takewhile
+
+from core import stampede
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+
+from . import objects
+from .counters import forget_counts
+from .models import CARD_FIELDS, FeedEntry, Follow, Post
+from .utils import KeysetPaginator, encode_cursor, paginator
+
+FEED_FIELDS = ('pub_date', 'post_id') + tuple(
+    f'post__{field}' for field in CARD_FIELDS
+)
+
+
+def _batches(queryset, key):
+    """Обходит queryset пачками по FEED_FANOUT_BATCH строк,
+    продвигаясь по возрастанию key без OFFSET."""
+    batch_size = settings.FEED_FANOUT_BATCH
+    queryset = queryset.order_by(key)
+    last = None
+    while True:
+        page = queryset
+        if last is not None:
+            page = page.filter(**{f'{key}__gt': last})
+        batch = list(page[:batch_size])
+        if not batch:
+            return
+        yield batch
+        last = batch[-1][0]
+
+
+def fan_out_post(post):
+    """Раскладывает новый пост в ленты всех подписчиков автора."""
+    followers = Follow.objects.filter(
+        author_id=post.author_id).values_list('user_id')
+    for batch in _batches(followers, 'user_id'):
+        with transaction.atomic():
+            FeedEntry.objects.bulk_create(
+                [FeedEntry(user_id=user_id, post_id=post.pk,
+                           pub_date=post.pub_date)
+                 for user_id, in batch],
+                ignore_conflicts=True
+            )
+        forget_counts(*(f'feed:{user_id}' for user_id, in batch))
+
+
+def forget_follower_counts(author_id):
+    """Сбрасывает счётчики лент всех подписчиков автора."""
+    followers = Follow.objects.filter(
+        author_id=author_id).values_list('user_id')
+    for batch in _batches(followers, 'user_id'):
+        forget_counts(*(f'feed:{user_id}' for user_id, in batch))
+
+
+def backfill_feed(user_id, author_id):
+    """Добавляет в ленту подписчика уже опубликованные посты автора."""
+    posts = Post.objects.filter(
+        author_id=author_id).values_list('id', 'pub_date')
+    for batch in _batches(posts, 'id'):
+        with transaction.atomic():
+            FeedEntry.objects.bulk_create(
+                [FeedEntry(user_id=user_id, post_id=post_id,
+                           pub_date=pub_date)
+                 for post_id, pub_date in batch],
+                ignore_conflicts=True
+            )
+
+
+def prune_feed(user_id, author_id):
+    """Убирает посты автора из ленты отписавшегося пользователя."""
+    FeedEntry.objects.filter(
+        user_id=user_id, post__author_id=author_id).delete()
+
+
+def rebuild_feed():
+    """Заново заполняет ленты по подпискам одним INSERT ... SELECT:
+    для данных, загруженных bulk_create без сигналов."""
+    entries = FeedEntry._meta.db_table
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {entries}')
+        cursor.execute(
+            f'INSERT INTO {entries} (user_id, post_id, pub_date) '
+            f'SELECT f.user_id, p.id, p.pub_date '
+            f'FROM {connection.ops.quote_name(Follow._meta.db_table)} f '
+            f'JOIN {Post._meta.db_table} p ON p.author_id = f.author_id'
+        )
+
+
+def feed_entries(user):
+    """Лента подписок пользователя вместе с данными карточек постов."""
+    return FeedEntry.objects.filter(user=user).select_related(
+        'post__author', 'post__group').only(*FEED_FIELDS)
+
+
+# Fan-out-on-read: лента собирается из кэшированных списков последних
+# постов каждого автора, на которого подписан пользователь.
+
+def recent_posts_key(author_id):
+    return f'feed:recent:{author_id}'
+
+
+def following_key(user_id):
+    return f'feed:following:{user_id}'
+
+
+def following_ids(user_id):
+    """Множество id авторов, на которых подписан пользователь."""
+    return stampede.fetch(
+        following_key(user_id),
+        lambda: frozenset(Follow.objects.filter(
+            user_id=user_id).values_list('author_id', flat=True)),
+        settings.FEED_CACHE_TIMEOUT)
+
+
+def forget_following(user_id):
+    cache.delete(following_key(user_id))
+
+
+def recent_posts(author_ids):
+    """Для каждого автора — список (pub_date, id) его последних постов,
+    от новых к старым, не длиннее FEED_RECENT_POSTS."""
+    keys = {recent_posts_key(author_id): author_id
+            for author_id in author_ids}
+    streams = cache.get_many(keys)
+    missing = {}
+    for key, author_id in keys.items():
+        if key not in streams:
+            missing[key] = list(Post.objects.filter(
+                author_id=author_id).order_by('-pub_date', '-id')
+                .values_list('pub_date', 'id')[:settings.FEED_RECENT_POSTS])
+    if missing:
+        cache.set_many(missing, settings.FEED_CACHE_TIMEOUT)
+        streams.update(missing)
+    return list(streams.values())
+
+
+def remember_post(post):
+    """Добавляет новый пост в список последних постов автора
+    на место по дате публикации."""
+    key = recent_posts_key(post.author_id)
+    stream = cache.get(key)
+    if stream is not None:
+        stream.append((post.pub_date, post.pk))
+        stream.sort(reverse=True)
+        cache.set(key, stream[:settings.FEED_RECENT_POSTS],
+                  settings.FEED_CACHE_TIMEOUT)
+
+
+def forget_post(post):
+    """Убирает удалённый пост из списка последних постов автора.
+
+    Полный список после удаления стал бы короче FEED_RECENT_POSTS
+    и перестал бы считаться обрезанным: посты старше него пропали бы
+    из ленты. Такой список сбрасывается и читается из базы заново."""
+    key = recent_posts_key(post.author_id)
+    stream = cache.get(key)
+    if stream is None:
+        return
+    if len(stream) >= settings.FEED_RECENT_POSTS:
+        cache.delete(key)
+        return
+    cache.set(key, [row for row in stream if row[1] != post.pk],
+              settings.FEED_CACHE_TIMEOUT)
+
+
+class FeedWindowExceeded(Exception):
+    """Страница выходит за пределы кэшированных списков постов."""
+
+
+class MergedFeedPaginator(KeysetPaginator):
+    """Курсорный вывод ленты, собранной k-way слиянием (heapq.merge)
+    списков последних постов авторов.
+
+    Списки обрезаны до FEED_RECENT_POSTS, поэтому для полных списков
+    посты старше их последнего элемента неизвестны: дальше этой границы
+    лента из кэша не строится и выбрасывается FeedWindowExceeded.
+    """
+
+    def __init__(self, streams, per_page):
+        super().__init__([], per_page)
+        self.streams = streams
+        limit = settings.FEED_RECENT_POSTS
+        self.horizon = max(
+            (stream[-1] for stream in streams if len(stream) >= limit),
+            default=None
+        )
+
+    def _merged(self):
+        return heapq.merge(*self.streams, reverse=True)
+
+    def _cursor_of(self, row):
+        return encode_cursor(*row)
+
+    def _fetch_before(self, cursor):
+        newer = list(takewhile(lambda row: row > cursor, self._merged()))
+        has_previous = len(newer) > self.per_page
+        return newer[-self.per_page:], has_previous
+
+    def _fetch_after(self, cursor):
+        rows = self._merged()
+        if cursor is not None:
+            rows = dropwhile(lambda row: row >= cursor, rows)
+        rows = list(islice(rows, self.per_page + 1))
+        if self.horizon is not None and (
+                len(rows) <= self.per_page or rows[-1] < self.horizon):
+            raise FeedWindowExceeded
+        has_next = len(rows) > self.per_page
+        return rows[:self.per_page], has_next
+
+
+def merged_feed_page(request, per_page):
+    streams = [stream for stream in recent_posts(
+        following_ids(request.user.pk)) if stream]
+    feed = MergedFeedPaginator(streams, per_page)
+    page_obj = feed.get_page(
+        request.GET.get('after'), request.GET.get('before'))
+    # Посты страницы с авторами и группами — пакетом из кэша объектов.
+    page_obj.object_list = objects.posts(
+        [post_id for pub_date, post_id in page_obj], request)
+    return page_obj
+
+
+def follow_page(request, per_page):
+    """Страница ленты подписок в режиме settings.FOLLOW_FEED_MODE:
+
+    'write' — из материализованной таблицы FeedEntry;
+    'read'  — слиянием кэшированных списков постов авторов;
+    'join'  — прямым JOIN Follow и Post.
+    """
+    mode = settings.FOLLOW_FEED_MODE
+    if mode == 'read' and settings.POSTS_PAGINATION != 'offset':
+        try:
+            return merged_feed_page(request, per_page)
+        except FeedWindowExceeded:
+            mode = 'join'
+    scope = f'feed:{request.user.pk}'
+    if mode == 'write':
+        entries = feed_entries(request.user)
+        page_obj = paginator(entries, request, per_page,
+                             id_field='post_id', count_scope=scope)
+        page_obj.object_list = [entry.post for entry in page_obj]
+        return page_obj
+    posts = Post.objects.for_cards().filter(
+        author__following__user=request.user)
+    return paginator(posts, request, per_page, count_scope=scope)
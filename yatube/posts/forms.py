@@ -3,6 +3,7 @@ from xml.etree.ElementTree import Comment
 from django import forms
 
 from .models import Comment, Post
+from .uploads import check_image_header, too_large_error
 
 
 class PostForm(forms.ModelForm):
@@ -13,6 +14,29 @@ class PostForm(forms.ModelForm):
         help_texts = {'text': 'Введите текст публикации',
                       'group': 'Выберите группу', }
 
+    def __init__(self, *args, oversized_upload=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Заголовок картинки проверяется до ImageField: отклонённый файл
+        # не попадёт ни в verify() Pillow, ни тем более в базу.
+        # Слишком большой файл до формы не доходит, о нём сообщает
+        # обработчик загрузки (posts.uploads.oversized_upload).
+        self.image_error = None
+        image = self.files.get('image')
+        if oversized_upload == 'image':
+            self.image_error = too_large_error()
+        elif image is not None:
+            try:
+                check_image_header(image)
+            except forms.ValidationError as error:
+                self.image_error = error
+                self.files = self.files.copy()
+                del self.files['image']
+
+    def clean_image(self):
+        if self.image_error is not None:
+            raise self.image_error
+        return self.cleaned_data['image']
+
 
 class CommentForm(forms.ModelForm):
     class Meta:
@@ -0,0 +1,81 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.migrations.loader import MigrationLoader
+from django.db.migrations.writer import MigrationWriter
+
+from posts.query_plans import (audit, finding_key, index_migration,
+                               load_baseline, save_baseline)
+
+
+class Command(BaseCommand):
+    help = ('Открывает страницы posts, users и about на тестовых данных, '
+            'разбирает EXPLAIN QUERY PLAN каждого запроса и падает, если '
+            'появились полные просмотры таблиц или временные B-деревья, '
+            'которых нет в базовом отчёте. Рекомендованные составные '
+            'индексы, которых нет в миграциях, выводит и по --make-migration '
+            'записывает миграцией posts.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--baseline', default=settings.QUERY_AUDIT_BASELINE,
+            help='Файл с уже известными находками.')
+        parser.add_argument(
+            '--update-baseline', action='store_true',
+            help='Записать текущие находки в базовый отчёт.')
+        parser.add_argument(
+            '--make-migration', action='store_true',
+            help='Записать миграцию с недостающими рекомендованными '
+                 'индексами.')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('Аудит разбирает только планы SQLite.')
+        reports = audit()
+        known = load_baseline(options['baseline'])
+        regressions = []
+        for report in reports:
+            self.stdout.write(
+                f"{report['url']} {report['path']} "
+                f"[{report['status']}] запросов: {report['queries']}"
+            )
+            for finding in report['findings']:
+                key = finding_key(finding)
+                new = key not in known
+                if new:
+                    regressions.append(key)
+                mark = self.style.ERROR('НОВОЕ') if new else 'известно'
+                self.stdout.write(
+                    f"  {mark} {finding['kind']} {finding['table']}: "
+                    f"{finding['sql'][:200]}"
+                )
+        self.recommend(options['make_migration'])
+        if options['update_baseline']:
+            save_baseline(options['baseline'], reports)
+            self.stdout.write(self.style.SUCCESS(
+                f"Базовый отчёт записан в {options['baseline']}"))
+            return
+        if regressions:
+            raise CommandError(
+                'Новые проблемы в планах запросов:\n'
+                + '\n'.join(sorted(set(regressions)))
+            )
+        self.stdout.write(self.style.SUCCESS('Новых проблем нет.'))
+
+    def recommend(self, make_migration):
+        migration = index_migration(
+            MigrationLoader(None, ignore_no_migrations=True))
+        if migration is None:
+            self.stdout.write('Рекомендованные индексы уже есть.')
+            return
+        for operation in migration.operations:
+            self.stdout.write(
+                f'  {self.style.WARNING("ИНДЕКС")} {operation.describe()}')
+        if not make_migration:
+            return
+        writer = MigrationWriter(migration)
+        with open(writer.path, 'w', encoding='utf-8') as file:
+            file.write(writer.as_string())
+        self.stdout.write(self.style.SUCCESS(
+            f'Миграция записана в {writer.path}; перенесите индексы '
+            f'в Meta.indexes моделей, иначе makemigrations их удалит.'))
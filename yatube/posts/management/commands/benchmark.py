@@ -0,0 +1,61 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from posts.benchmark import compare, run
+from posts.seeding import seed
+
+
+class Command(BaseCommand):
+    help = ('Нагружает публичные и закрытые страницы запущенного сервера '
+            'и записывает p50/p95/p99, RPS и число SQL-запросов в JSON.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--url', default='http://127.0.0.1:8000',
+            help='Адрес сервера, работающего с той же базой.')
+        parser.add_argument('--requests', type=int, default=200,
+                            help='Запросов на каждую страницу.')
+        parser.add_argument('--concurrency', type=int, default=8,
+                            help='Одновременных клиентов.')
+        parser.add_argument('--only', nargs='*',
+                            help='Имена URL, которые нужно проверить.')
+        parser.add_argument('--output', default='benchmark.json',
+                            help='Файл для результатов.')
+        parser.add_argument('--compare',
+                            help='Базовый файл результатов для сравнения.')
+        parser.add_argument('--tolerance', type=float, default=0.2,
+                            help='Допустимое ухудшение задержки и RPS.')
+        parser.add_argument('--seed', action='store_true',
+                            help='Сначала заполнить базу набором данных '
+                                 '(подробнее — команда seed_yatube).')
+        parser.add_argument('--users', type=int, default=50_000)
+        parser.add_argument('--groups', type=int, default=500)
+        parser.add_argument('--posts', type=int, default=1_000_000)
+        parser.add_argument('--follows', type=int, default=2_000_000)
+        parser.add_argument('--comments', type=int, default=1_000_000)
+
+    def handle(self, *args, **options):
+        if options['seed']:
+            seed(options['users'], options['groups'], options['posts'],
+                 options['follows'], options['comments'])
+            self.stdout.write(self.style.SUCCESS('База заполнена.'))
+        results = run(options['url'], options['requests'],
+                      options['concurrency'], options['only'])
+        for name, result in results.items():
+            self.stdout.write(
+                f"{name}: p50 {result['p50']} p95 {result['p95']} "
+                f"p99 {result['p99']} мс, {result['rps']} rps, "
+                f"SQL {result['queries']}, ошибок {result['errors']}"
+            )
+        with open(options['output'], 'w', encoding='utf-8') as file:
+            json.dump(results, file, ensure_ascii=False, indent=2)
+        if options['compare']:
+            with open(options['compare'], encoding='utf-8') as file:
+                regressions = compare(
+                    results, json.load(file), options['tolerance'])
+            if regressions:
+                raise CommandError(
+                    'Регрессии производительности:\n'
+                    + '\n'.join(regressions))
+            self.stdout.write(self.style.SUCCESS('Регрессий нет.'))
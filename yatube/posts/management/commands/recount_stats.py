@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from posts.counters import recount_groups, recount_users
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает счётчики пользователей и групп по данным таблиц.'
+
+    def handle(self, *args, **options):
+        users = recount_users()
+        groups = recount_groups()
+        self.stdout.write(self.style.SUCCESS(
+            f'Исправлено строк статистики: {users}, групп: {groups}'
+        ))
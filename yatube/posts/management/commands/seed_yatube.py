@@ -0,0 +1,50 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from posts.seeding import PASSWORD, Seeder, image_pool
+
+
+class Command(BaseCommand):
+    help = ('Заполняет базу реалистичным набором данных: пользователи, '
+            'группы, посты с неравной популярностью авторов, подписки '
+            'и комментарии.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=50_000)
+        parser.add_argument('--groups', type=int, default=500)
+        parser.add_argument('--posts', type=int, default=1_000_000)
+        parser.add_argument('--follows', type=int, default=2_000_000)
+        parser.add_argument('--comments', type=int, default=1_000_000)
+        parser.add_argument('--batch', type=int, default=10_000,
+                            help='Строк в одном bulk_create и транзакции.')
+        parser.add_argument('--skew', type=float, default=1.1,
+                            help='Показатель закона Ципфа для авторов.')
+        parser.add_argument('--days', type=int, default=365,
+                            help='За сколько дней распределить посты.')
+        parser.add_argument('--prefix', default='seed',
+                            help='Префикс имён пользователей и slug групп.')
+        parser.add_argument('--images',
+                            help='Каталог с картинками для постов.')
+        parser.add_argument('--image-ratio', type=float, default=0.3,
+                            help='Доля постов с картинкой.')
+
+    def handle(self, *args, **options):
+        images = ()
+        if options['images']:
+            if not os.path.isdir(options['images']):
+                raise CommandError(f"Нет каталога {options['images']}.")
+            images = image_pool(options['images'])
+        seeder = Seeder(
+            batch=options['batch'], skew=options['skew'],
+            days=options['days'], images=images,
+            image_ratio=options['image_ratio'], prefix=options['prefix'],
+            stdout=self.stdout)
+        started = time.monotonic()
+        seeder.seed(options['users'], options['groups'], options['posts'],
+                    options['follows'], options['comments'])
+        self.stdout.write(self.style.SUCCESS(
+            f'База заполнена за {time.monotonic() - started:.0f} с. '
+            f'Пароль пользователей: {PASSWORD}'
+        ))
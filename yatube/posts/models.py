@@ -6,6 +6,13 @@ User = get_user_model()
 
 LEN_POST: int = 15
 
+# Поля, которые выводит карточка поста в списках.
+CARD_FIELDS = (
+    'id', 'text', 'pub_date', 'updated_at', 'image', 'author_id', 'group_id',
+    'author__username', 'author__first_name', 'author__last_name',
+    'group__slug', 'group__title',
+)
+
 
 class Group(models.Model):
     title = models.CharField(
@@ -19,11 +26,23 @@ class Group(models.Model):
         verbose_name='Описание группы',
         help_text='Введите описание группы'
     )
+    posts_count = models.PositiveIntegerField(
+        verbose_name='Число постов',
+        default=0,
+        editable=False
+    )
 
     def __str__(self) -> str:
         return self.title
 
 
+class PostQuerySet(models.QuerySet):
+    def for_cards(self):
+        """Посты для карточек списка: автор и группа в том же запросе,
+        без колонок, которые карточка не показывает."""
+        return self.select_related('author', 'group').only(*CARD_FIELDS)
+
+
 class Post(CreatedModel):
     text = models.TextField(
         verbose_name='Текст поста',
@@ -53,6 +72,27 @@ class Post(CreatedModel):
         upload_to='posts/',
         blank=True
     )
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        verbose_name='Дата изменения'
+    )
+
+    objects = PostQuerySet.as_manager()
+
+    class Meta(CreatedModel.Meta):
+        # Ленты выводятся от новых к старым с id для одинаковых дат:
+        # индексы отдают первую страницу без сортировки всей выборки.
+        indexes = [
+            models.Index(
+                fields=['-pub_date', '-id'],
+                name='post_pub_date_idx'),
+            models.Index(
+                fields=['author', '-pub_date', '-id'],
+                name='post_author_pub_date_idx'),
+            models.Index(
+                fields=['group', '-pub_date', '-id'],
+                name='post_group_pub_date_idx'),
+        ]
 
 
 class Comment(models.Model):
@@ -85,6 +125,11 @@ class Comment(models.Model):
 
     class Meta:
         ordering = ['created']
+        indexes = [
+            models.Index(
+                fields=['post', 'created'],
+                name='comment_post_created_idx')
+        ]
         verbose_name = "Комментарий"
         verbose_name_plural = 'Комментарии'
 
@@ -111,4 +156,98 @@ class Follow(models.Model):
             models.UniqueConstraint(
                 fields=['user', 'author'], name='unique_follow')
         ]
+        # Подписчики автора по порядку: раскладка постов и сброс счётчиков.
+        indexes = [
+            models.Index(
+                fields=['author', 'user'],
+                name='follow_author_user_idx')
+        ]
         verbose_name_plural = 'Подписки'
+
+
+class FeedEntry(models.Model):
+    """Пост в ленте подписчика, материализованный при записи."""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+        verbose_name='Подписчик'
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+        verbose_name='Пост'
+    )
+    pub_date = models.DateTimeField(
+        verbose_name='Дата поста'
+    )
+
+    class Meta:
+        ordering = ['-pub_date', '-post']
+        indexes = [
+            models.Index(
+                fields=['user', '-pub_date', '-post'],
+                name='feed_user_pub_date_idx')
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'post'], name='unique_feed_entry')
+        ]
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Лента подписок'
+
+
+class UserStats(models.Model):
+    """Счётчики пользователя, обновляемые при записи."""
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='stats',
+        verbose_name='Пользователь'
+    )
+    posts_count = models.PositiveIntegerField(
+        verbose_name='Число постов', default=0)
+    comments_count = models.PositiveIntegerField(
+        verbose_name='Число комментариев', default=0)
+    followers_count = models.PositiveIntegerField(
+        verbose_name='Число подписчиков', default=0)
+    following_count = models.PositiveIntegerField(
+        verbose_name='Число подписок', default=0)
+
+    class Meta:
+        verbose_name = 'Статистика пользователя'
+        verbose_name_plural = 'Статистика пользователей'
+
+
+class SearchField(models.TextField):
+    """Колонка поискового индекса FTS5: поддерживает lookup match."""
+
+
+@SearchField.register_lookup
+class Match(models.Lookup):
+    lookup_name = 'match'
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f'{lhs} MATCH {rhs}', lhs_params + rhs_params
+
+
+class PostIndex(models.Model):
+    """Поисковый индекс постов: виртуальная таблица FTS5 из миграции
+    0015_post_fts, которую заполняют триггеры. Только для чтения:
+    посты соединяются с ней по rowid."""
+    post = models.OneToOneField(
+        Post,
+        on_delete=models.DO_NOTHING,
+        primary_key=True,
+        db_column='rowid',
+        related_name='search_index',
+    )
+    text = SearchField()
+
+    class Meta:
+        managed = False
+        db_table = 'posts_post_fts'
@@ -0,0 +1,187 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import Http404
+
+from .models import Group, Post, User, UserStats
+
+# Кэш объектов для частых поисков: пост по id, группа по slug,
+# пользователь по username. Объекты хранятся по id без связанных
+# моделей: автор и группа поста подставляются из своих записей кэша,
+# поэтому правка пользователя или группы не сбрасывает все его посты.
+# Поиск по slug и username идёт через ключ «значение → id». Внутри
+# запроса объекты запоминаются в request и повторно не запрашиваются.
+# Отсутствующие id и значения тоже кэшируются, на MISSING_CACHE_TIMEOUT
+# секунд: перебор несуществующих адресов не доходит до базы.
+
+MISSING = '<missing>'
+
+# Кэш общий для процессов и лежит на диске, поэтому у пользователя
+# хранятся только публичные поля и счётчики, без пароля и почты.
+USER_FIELDS = ('username', 'first_name', 'last_name') + tuple(
+    f'stats__{field.name}' for field in UserStats._meta.concrete_fields
+)
+
+
+def _fields(model, prefix=''):
+    return [prefix + field.name for field in model._meta.concrete_fields]
+
+
+QUERYSETS = {
+    'post': lambda: Post.objects.select_related(
+        'author__stats', 'group').only(
+            *_fields(Post), *_fields(Group, 'group__'),
+            *(f'author__{field}' for field in USER_FIELDS)),
+    'group': lambda: Group.objects.all(),
+    'user': lambda: User.objects.select_related('stats').only(*USER_FIELDS),
+}
+
+# Уникальные поля, по которым объект ищется через get_by.
+ALIASES = {'group': 'slug', 'user': 'username'}
+
+# Связанные объекты, которые приходят тем же запросом при промахе
+# и кладутся в кэш отдельными записями: {поле: имя в кэше}.
+RELATED = {
+    'post': {'author': 'user', 'group': 'group'},
+}
+
+
+def object_key(name, pk):
+    return f'object:{name}:{pk}'
+
+
+def alias_key(name, field, value):
+    # Значение приходит из адреса как есть: хэш держит ключ коротким
+    # и без пробелов и управляющих символов.
+    digest = hashlib.md5(str(value).encode()).hexdigest()
+    return f'object:{name}:{field}:{digest}'
+
+
+def _memo(request):
+    if request is None:
+        return {}
+    if not hasattr(request, '_objects'):
+        request._objects = {}
+    return request._objects
+
+
+def get_many(name, pks, request=None):
+    """Объекты по списку id: {id: объект}, без отсутствующих.
+    Одно обращение к кэшу на всю пачку и один запрос на промахи."""
+    memo = _memo(request)
+    keys = {object_key(name, pk): pk for pk in pks if pk is not None}
+    found = {keys[key]: memo[key] for key in keys if key in memo}
+    wanted = [key for key in keys if key not in memo]
+    cached = cache.get_many(wanted)
+    found.update((keys[key], value) for key, value in cached.items())
+    missing = [keys[key] for key in wanted if key not in cached]
+    if missing:
+        loaded = QUERYSETS[name]().in_bulk(missing)
+        entries = {object_key(name, pk): obj for pk, obj in loaded.items()}
+        entries.update(_detach(name, loaded.values()))
+        cache.set_many(entries, settings.OBJECT_CACHE_TIMEOUT)
+        absent = {object_key(name, pk): MISSING
+                  for pk in missing if pk not in loaded}
+        cache.set_many(absent, settings.MISSING_CACHE_TIMEOUT)
+        memo.update(entries)
+        memo.update(absent)
+        found.update(loaded)
+    for pk, obj in found.items():
+        memo[object_key(name, pk)] = obj
+    return {pk: obj for pk, obj in found.items() if obj != MISSING}
+
+
+def _detach(name, objs):
+    """Отцепляет от объектов связанные из RELATED и возвращает их
+    записями кэша: запись поста не должна хранить копию автора."""
+    entries = {}
+    for field, related_name in RELATED.get(name, {}).items():
+        for obj in objs:
+            related = getattr(obj, field)
+            if related is not None:
+                entries[object_key(related_name, related.pk)] = related
+            obj._state.fields_cache.pop(field, None)
+    return entries
+
+
+def get(name, pk, request=None):
+    return get_many(name, [pk], request).get(pk)
+
+
+def get_by(name, field, value, request=None):
+    """Объект по уникальному полю или None. Ключ «значение → id»
+    проверяется по самому объекту: после переименования старое
+    значение не находит объект с новым."""
+    key = alias_key(name, field, value)
+    pk = cache.get(key)
+    if pk == MISSING:
+        return None
+    if pk is not None:
+        obj = get(name, pk, request)
+        if obj is not None and getattr(obj, field) == value:
+            return obj
+    obj = QUERYSETS[name]().filter(**{field: value}).first()
+    if obj is None:
+        cache.set(key, MISSING, settings.MISSING_CACHE_TIMEOUT)
+        return None
+    cache.set_many({
+        key: obj.pk,
+        object_key(name, obj.pk): obj,
+    }, settings.OBJECT_CACHE_TIMEOUT)
+    _memo(request)[object_key(name, obj.pk)] = obj
+    return obj
+
+
+def attach_related(posts, request=None):
+    """Подставляет постам авторов и группы из кэша объектов."""
+    users = get_many('user', {post.author_id for post in posts}, request)
+    groups = get_many('group', {post.group_id for post in posts}, request)
+    for post in posts:
+        post.author = users[post.author_id]
+        post.group = groups.get(post.group_id)
+    return posts
+
+
+def posts(pks, request=None):
+    """Посты по списку id вместе с авторами и группами, в порядке pks."""
+    found = get_many('post', pks, request)
+    return attach_related(
+        [found[pk] for pk in pks if pk in found], request)
+
+
+def post_or_404(request, pk):
+    try:
+        pk = int(pk)
+    except (TypeError, ValueError):
+        raise Http404('Пост не найден.')
+    found = posts([pk], request)
+    if not found:
+        raise Http404('Пост не найден.')
+    return found[0]
+
+
+def group_or_404(request, slug):
+    group = get_by('group', 'slug', slug, request)
+    if group is None:
+        raise Http404('Группа не найдена.')
+    return group
+
+
+def user_or_404(request, username):
+    user = get_by('user', 'username', username, request)
+    if user is None:
+        raise Http404('Пользователь не найден.')
+    return user
+
+
+def forget(name, *pks):
+    cache.delete_many([object_key(name, pk) for pk in pks])
+
+
+def forget_alias(name, obj):
+    """Сбрасывает ключ «значение → id» объекта вместе с отметкой
+    об отсутствии: новый объект сразу находится по slug и username."""
+    field = ALIASES.get(name)
+    if field is not None:
+        cache.delete(alias_key(name, field, getattr(obj, field)))
@@ -0,0 +1,201 @@
+import json
+import os
+import re
+from importlib import import_module
+
+from django.contrib.auth.tokens import default_token_generator
+from django.db import connection, migrations, models, transaction
+from django.db.migrations.autodetector import MigrationAutodetector
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from django.utils.encoding import force_bytes
+from django.utils.http import urlsafe_base64_encode
+
+from .models import Comment, Follow, Group, Post, User
+
+# Приложения, чьи URL проигрываются при аудите.
+AUDITED_APPS = ('posts', 'users', 'about')
+# Параметры запроса для адресов, которым они нужны.
+QUERY_STRINGS = {'posts:search': 'q=аудит'}
+# Операторы, которые имеет смысл разбирать планировщиком.
+EXPLAINED = ('SELECT', 'UPDATE', 'DELETE')
+AUDIT_POSTS = 25
+TABLE_TOKENS = re.compile(r'[()]|\b(?:FROM|UPDATE) "?(\w+)"?')
+# Во время аудита кэш отключён: иначе часть страниц вообще
+# не дойдёт до базы и их запросы останутся непроверенными.
+NO_CACHE = {'default': {
+    'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}
+# Составные индексы для лент, комментариев и подписок, которые
+# рекомендует аудит: модель posts, поля и имя индекса.
+RECOMMENDED_INDEXES = (
+    ('post', ('author', '-pub_date', '-id'), 'post_author_pub_date_idx'),
+    ('post', ('group', '-pub_date', '-id'), 'post_group_pub_date_idx'),
+    ('comment', ('post', 'created'), 'comment_post_created_idx'),
+    ('follow', ('user',), 'follow_user_idx'),
+)
+
+
+def audited_urls():
+    """Пары (имя URL, список параметров) всех проверяемых адресов."""
+    for app in AUDITED_APPS:
+        urls = import_module(f'{app}.urls')
+        for pattern in urls.urlpatterns:
+            yield (f'{urls.app_name}:{pattern.name}',
+                   list(pattern.pattern.converters))
+
+
+def seed():
+    """Небольшой набор данных, на котором открывается каждая страница.
+    Возвращает пользователя-клиента и значения параметров URL."""
+    author = User.objects.create_user('query_audit_author')
+    reader = User.objects.create_user('query_audit_reader')
+    group = Group.objects.create(
+        title='Аудит', slug='query-audit', description='Аудит запросов')
+    for number in range(AUDIT_POSTS):
+        Post.objects.create(
+            text=f'Пост для аудита {number}', author=reader, group=group)
+    post = Post.objects.create(
+        text='Пост для аудита', author=author, group=group)
+    Comment.objects.create(text='Комментарий', post=post, author=reader)
+    Follow.objects.create(user=author, author=reader)
+    return author, {
+        'slug': group.slug,
+        'username': reader.username,
+        'post_id': post.pk,
+        'uidb64': urlsafe_base64_encode(force_bytes(author.pk)),
+        'token': default_token_generator.make_token(author),
+    }
+
+
+def explain(sql):
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+        return [row[-1] for row in cursor.fetchall()]
+
+
+def main_table(sql):
+    """Таблица внешнего запроса, без подзапросов в скобках."""
+    depth = 0
+    for token in TABLE_TOKENS.finditer(sql):
+        if token.group() == '(':
+            depth += 1
+        elif token.group() == ')':
+            depth -= 1
+        elif depth == 0:
+            return token.group(1)
+    return None
+
+
+def plan_problems(sql, plan):
+    """Находит в плане SQLite полные просмотры таблиц, временные
+    B-деревья для сортировки и группировки и автоматические индексы,
+    которые SQLite строит на лету из-за отсутствия подходящего.
+
+    Просмотр по индексу (SCAN ... USING INDEX) не считается проблемой:
+    он отдаёт строки в нужном порядке и обрывается на LIMIT. Сортировку
+    без индекса выдаёт временное B-дерево, его относим к главной
+    таблице запроса.
+    """
+    table = main_table(sql)
+    for detail in plan:
+        words = detail.replace(' TABLE ', ' ').split()
+        if words[0] in ('SCAN', 'SEARCH') and 'AUTOMATIC' in words:
+            yield 'automatic_index', words[1]
+        elif words[0] == 'SCAN' and not {'USING', 'VIRTUAL'} & set(words):
+            yield 'scan', words[1]
+        elif 'TEMP B-TREE' in detail:
+            yield 'temp_btree', table
+
+
+def audit_url(client, name, kwargs):
+    """Открывает страницу и разбирает план каждого её запроса."""
+    url = reverse(name, kwargs=kwargs)
+    if name in QUERY_STRINGS:
+        url = f'{url}?{QUERY_STRINGS[name]}'
+    with CaptureQueriesContext(connection) as queries:
+        response = client.get(url)
+    findings = []
+    for query in queries.captured_queries:
+        sql = query['sql']
+        if not sql.lstrip().upper().startswith(EXPLAINED):
+            continue
+        for kind, table in plan_problems(sql, explain(sql)):
+            findings.append({
+                'url': name, 'kind': kind, 'table': table, 'sql': sql})
+    return {
+        'url': name, 'path': url, 'status': response.status_code,
+        'queries': len(queries), 'findings': findings,
+    }
+
+
+def audit():
+    """Проигрывает все проверяемые адреса на свежих тестовых данных
+    и возвращает отчёт по каждому. Данные откатываются после аудита."""
+    reports = []
+    with override_settings(CACHES=NO_CACHE), transaction.atomic():
+        user, values = seed()
+        client = Client()
+        for name, params in audited_urls():
+            client.force_login(user)
+            reports.append(audit_url(
+                client, name, {param: values[param] for param in params}))
+        transaction.set_rollback(True)
+    return reports
+
+
+def finding_key(finding):
+    return f"{finding['url']} {finding['kind']} {finding['table']}"
+
+
+def load_baseline(path):
+    if not os.path.exists(path):
+        return set()
+    with open(path, encoding='utf-8') as file:
+        return set(json.load(file))
+
+
+def save_baseline(path, reports):
+    keys = sorted({finding_key(finding)
+                   for report in reports for finding in report['findings']})
+    with open(path, 'w', encoding='utf-8') as file:
+        json.dump(keys, file, ensure_ascii=False, indent=2)
+        file.write('\n')
+
+
+def covered(model_state, fields):
+    """Начинается ли с fields индекс или уникальное ограничение модели:
+    такой индекс SQLite использует и для префикса полей."""
+    options = model_state.options
+    existing = [index.fields for index in options.get('indexes', [])]
+    existing += [constraint.fields
+                 for constraint in options.get('constraints', [])
+                 if isinstance(constraint, models.UniqueConstraint)]
+    existing += options.get('unique_together', ())
+    return any(tuple(other[:len(fields)]) == fields for other in existing)
+
+
+def missing_indexes(state):
+    """AddIndex для рекомендованных индексов, которых нет в состоянии
+    миграций posts."""
+    return [
+        migrations.AddIndex(
+            model, models.Index(fields=list(fields), name=name))
+        for model, fields, name in RECOMMENDED_INDEXES
+        if not covered(state.models['posts', model], fields)
+    ]
+
+
+def index_migration(loader):
+    """Миграция posts с недостающими рекомендованными индексами
+    или None, если добавлять нечего."""
+    operations = missing_indexes(loader.project_state())
+    if not operations:
+        return None
+    leaf = max(loader.graph.leaf_nodes('posts'))
+    number = MigrationAutodetector.parse_number(leaf[1]) + 1
+    migration = migrations.Migration(
+        f'{number:04d}_query_audit_indexes', 'posts')
+    migration.dependencies = [leaf]
+    migration.operations = operations
+    return migration
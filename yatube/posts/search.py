@@ -0,0 +1,77 @@
+import re
+from contextlib import contextmanager
+
+from django.db import connection
+from django.db.models import FloatField
+from django.db.models.expressions import RawSQL
+
+from .models import Post, PostIndex
+
+FTS_TABLE = PostIndex._meta.db_table
+WORD = re.compile(r'\w+')
+INSERT_TRIGGER = 'posts_post_fts_insert'
+CREATE_INSERT_TRIGGER = f"""
+CREATE TRIGGER {INSERT_TRIGGER} AFTER INSERT ON posts_post
+BEGIN
+    INSERT INTO {FTS_TABLE}(rowid, text) VALUES (new.id, new.text);
+END"""
+
+
+def match_expression(query):
+    """Превращает ввод пользователя в безопасный запрос FTS5:
+    каждое слово берётся в кавычки, последнее ищется как префикс."""
+    words = WORD.findall(query)
+    if not words:
+        return ''
+    terms = [f'"{word}"' for word in words]
+    terms[-1] += '*'
+    return ' '.join(terms)
+
+
+def search_posts(query, posts=None):
+    """Посты, подходящие под запрос, с рангом BM25 в поле score
+    (чем больше, тем релевантнее), от лучших к худшим."""
+    if posts is None:
+        posts = Post.objects.all()
+    match = match_expression(query)
+    if not match or connection.vendor != 'sqlite':
+        # Пустой ответ тоже с полем score: по нему сортирует пагинатор.
+        posts = posts.annotate(
+            score=RawSQL('0.0', [], output_field=FloatField()))
+        if not match:
+            return posts.none()
+        posts = posts.filter(text__icontains=query)
+    else:
+        # Одно соединение с индексом по rowid: MATCH выполняется один раз,
+        # а скрытая колонка rank отдаёт bm25 найденной им строки и, в отличие
+        # от функции bm25(), доступна и во внешнем запросе count().
+        posts = posts.filter(search_index__text__match=match).annotate(
+            score=RawSQL(f'-"{FTS_TABLE}"."rank"', [],
+                         output_field=FloatField()))
+    return posts.order_by('-score', '-id')
+
+
+def rebuild_index():
+    """Перестраивает поисковый индекс по всей таблице постов."""
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+
+
+@contextmanager
+def suspended_index():
+    """Отключает обновление индекса на каждую вставку поста: при массовой
+    загрузке один rebuild в конце в разы быстрее построчного триггера."""
+    if connection.vendor != 'sqlite':
+        yield
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DROP TRIGGER IF EXISTS {INSERT_TRIGGER}')
+    try:
+        yield
+    finally:
+        with connection.cursor() as cursor:
+            cursor.execute(CREATE_INSERT_TRIGGER)
+        rebuild_index()
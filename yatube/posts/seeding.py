@@ -0,0 +1,228 @@
+import os
+import random
+from contextlib import contextmanager
+from datetime import timedelta
+from itertools import accumulate, islice
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .caching import bump_content_version
+from .counters import forget_counts, recount_groups, recount_users
+from .feed import rebuild_feed
+from .models import Comment, Follow, Group, Post, User
+from .search import suspended_index
+
+# Пароль всех сгенерированных пользователей: хэшируется один раз.
+PASSWORD = 'seed-password'
+PREFIX = 'seed'
+
+
+@contextmanager
+def _fast_sqlite():
+    """Для SQLite на время загрузки отключает fsync после каждой пачки.
+    Внутри транзакции режим менять нельзя, там всё остаётся как есть."""
+    if connection.vendor != 'sqlite' or connection.in_atomic_block:
+        yield
+        return
+    with connection.cursor() as cursor:
+        cursor.execute('PRAGMA synchronous')
+        synchronous = cursor.fetchone()[0]
+        cursor.execute('PRAGMA synchronous = OFF')
+    try:
+        yield
+    finally:
+        with connection.cursor() as cursor:
+            cursor.execute(f'PRAGMA synchronous = {int(synchronous)}')
+
+
+def _adapt(value):
+    return connection.ops.adapt_datetimefield_value(value)
+
+
+class Seeder:
+    """Генератор набора данных: пользователи, группы, посты с неравной
+    популярностью авторов, подписки и комментарии.
+
+    Строки создаются пачками по batch, каждая пачка — в своей транзакции;
+    в памяти не бывает больше одной пачки. Массовые таблицы (посты,
+    подписки, комментарии) пишутся через executemany в обход ORM:
+    сборка SQL для каждого объекта в bulk_create дороже самой вставки.
+    Сигналы при этом не срабатывают, поэтому счётчики, ленты и поисковый
+    индекс пересчитываются в конце одним проходом."""
+
+    def __init__(self, batch=10000, skew=1.1, days=365, images=(),
+                 image_ratio=0.0, prefix=PREFIX, stdout=None):
+        self.batch = batch
+        self.skew = skew
+        self.days = days
+        self.images = list(images)
+        self.image_ratio = image_ratio
+        self.prefix = prefix
+        self.stdout = stdout
+
+    def log(self, message):
+        if self.stdout is not None:
+            self.stdout.write(message)
+
+    def _bulk(self, model, rows):
+        rows = iter(rows)
+        total = 0
+        while True:
+            batch = list(islice(rows, self.batch))
+            if not batch:
+                break
+            with transaction.atomic():
+                model.objects.bulk_create(batch, ignore_conflicts=True)
+            total += len(batch)
+        self.log(f'{model._meta.verbose_name_plural}: {total}')
+
+    def _insert(self, model, fields, rows):
+        """Вставляет кортежи значений полей fields пачками через
+        executemany; дубликаты по уникальным ограничениям пропускаются."""
+        opts = model._meta
+        ops = connection.ops
+        columns = ', '.join(
+            ops.quote_name(opts.get_field(field).column) for field in fields)
+        sql = '{} {} ({}) VALUES ({}) {}'.format(
+            ops.insert_statement(ignore_conflicts=True),
+            ops.quote_name(opts.db_table), columns,
+            ', '.join(['%s'] * len(fields)),
+            ops.ignore_conflicts_suffix_sql(ignore_conflicts=True))
+        rows = iter(rows)
+        total = 0
+        while True:
+            batch = list(islice(rows, self.batch))
+            if not batch:
+                break
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.executemany(sql, batch)
+            total += len(batch)
+        self.log(f'{opts.verbose_name_plural}: {total}')
+
+    def _ids(self, queryset):
+        return list(queryset.order_by('id').values_list('id', flat=True))
+
+    def _popularity(self, ids):
+        """Накопленные веса закона Ципфа: первый автор в списке
+        популярнее второго и т. д., хвост почти не пишет."""
+        return list(accumulate(
+            1 / (rank + 1) ** self.skew for rank in range(len(ids))))
+
+    def _picks(self, ids, weights, count):
+        """count случайных id с весами, выбранных пачками."""
+        while count > 0:
+            size = min(self.batch, count)
+            yield from random.choices(ids, cum_weights=weights, k=size)
+            count -= size
+
+    def users(self, count):
+        password = make_password(PASSWORD)
+        self._bulk(User, (
+            User(username=f'{self.prefix}_{n}', password=password,
+                 first_name='Пользователь', last_name=str(n))
+            for n in range(count)
+        ))
+        return self._ids(User.objects.filter(
+            username__startswith=f'{self.prefix}_'))
+
+    def groups(self, count):
+        self._bulk(Group, (
+            Group(title=f'Группа {n}', slug=f'{self.prefix}-{n}',
+                  description='Сгенерированная группа')
+            for n in range(count)
+        ))
+        return self._ids(Group.objects.filter(
+            slug__startswith=f'{self.prefix}-'))
+
+    def posts(self, count, user_ids, group_ids):
+        """Посты от старых к новым за последние days дней: id растут
+        вместе с датой, как в настоящей базе."""
+        start = timezone.now() - timedelta(days=self.days)
+        step = timedelta(days=self.days) / max(count, 1)
+        authors = self._picks(user_ids, self._popularity(user_ids), count)
+        groups = group_ids + [None]
+
+        def rows():
+            for n, author_id in enumerate(authors):
+                pub_date = _adapt(start + step * n)
+                image = ''
+                if self.images and random.random() < self.image_ratio:
+                    image = random.choice(self.images)
+                yield (f'Сгенерированный пост {n}', author_id,
+                       random.choice(groups), image, pub_date, pub_date)
+
+        self._insert(Post, ('text', 'author', 'group', 'image', 'pub_date',
+                            'updated_at'), rows())
+        return start, step
+
+    def follows(self, count, user_ids):
+        """Подписчики выбираются равномерно, авторы — по популярности;
+        повторы и подписки на себя отбрасываются. Порядок популярности
+        у подписок свой: иначе самые плодовитые авторы были бы и самыми
+        читаемыми, и ленты подписок росли бы квадратично."""
+        ranked = random.sample(user_ids, len(user_ids))
+        authors = self._picks(ranked, self._popularity(ranked), count)
+
+        def rows():
+            for author_id in authors:
+                user_id = random.choice(user_ids)
+                if user_id != author_id:
+                    yield user_id, author_id
+
+        self._insert(Follow, ('user', 'author'), rows())
+
+    def comments(self, count, user_ids, start, step):
+        posts = Post.objects.filter(pub_date__gte=start)
+        low = posts.order_by('id').values_list('id', flat=True).first()
+        high = posts.order_by('-id').values_list('id', flat=True).first()
+        if low is None:
+            return
+
+        def rows():
+            for n in range(count):
+                post_id = random.randint(low, high)
+                created = start + step * (post_id - low) + timedelta(
+                    minutes=random.randint(1, 24 * 60))
+                yield (f'Сгенерированный комментарий {n}', post_id,
+                       random.choice(user_ids), _adapt(created))
+
+        self._insert(Comment, ('text', 'post', 'author', 'created'), rows())
+
+    def seed(self, users, groups, posts, follows, comments):
+        with _fast_sqlite(), suspended_index():
+            user_ids = self.users(users)
+            group_ids = self.groups(groups)
+            start, step = self.posts(posts, user_ids, group_ids)
+            self.follows(follows, user_ids)
+            self.comments(comments, user_ids, start, step)
+        self.log('Пересчёт счётчиков и лент подписок')
+        recount_users()
+        recount_groups()
+        if settings.FOLLOW_FEED_MODE == 'write':
+            rebuild_feed()
+        # Вставки шли без сигналов: счётчики постов областей сбрасываются
+        # здесь, как и поколение контента.
+        forget_counts('all', *(
+            f'{scope}:{pk}' for pk in user_ids for scope in ('author', 'feed')
+        ), *(f'group:{pk}' for pk in group_ids))
+        bump_content_version()
+
+
+def seed(users, groups, posts, follows, comments, **options):
+    """Заполняет базу набором данных заданного размера."""
+    Seeder(**options).seed(users, groups, posts, follows, comments)
+
+
+def image_pool(directory):
+    """Копирует картинки из directory в медиа и возвращает их имена."""
+    names = []
+    for name in sorted(os.listdir(directory)):
+        path = os.path.join(directory, name)
+        if os.path.isfile(path):
+            with open(path, 'rb') as file:
+                names.append(default_storage.save(f'posts/seed/{name}', file))
+    return names
@@ -0,0 +1,104 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .caching import bump_content_version
+from .counters import (bump_group, bump_user, forget_counts,
+                       forget_post_counts)
+from .feed import (backfill_feed, fan_out_post, forget_follower_counts,
+                   forget_following, forget_post, prune_feed, remember_post)
+from .models import Comment, Follow, Group, Post, User, UserStats
+from .objects import forget, forget_alias
+from .thumbnails import schedule_image
+
+
+@receiver(post_save, sender=User)
+def user_created(sender, instance, created, **kwargs):
+    if created:
+        UserStats.objects.get_or_create(user=instance)
+
+
+@receiver(pre_save, sender=Post)
+def post_saving(sender, instance, **kwargs):
+    if instance.pk is not None:
+        instance._saved_group_id = Post.objects.filter(
+            pk=instance.pk).values_list('group_id', flat=True).first()
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, created, **kwargs):
+    if instance.image:
+        schedule_image(instance.image.name)
+    if created:
+        fan_out_post(instance)
+        remember_post(instance)
+        bump_user(instance.author_id, posts_count=1)
+        bump_group(instance.group_id, 1)
+        forget_post_counts(instance.author_id, instance.group_id)
+        return
+    saved_group_id = getattr(instance, '_saved_group_id', None)
+    if saved_group_id != instance.group_id:
+        bump_group(saved_group_id, -1)
+        bump_group(instance.group_id, 1)
+        forget_post_counts(
+            instance.author_id, saved_group_id, instance.group_id)
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    forget_post(instance)
+    forget_follower_counts(instance.author_id)
+    bump_user(instance.author_id, posts_count=-1)
+    bump_group(instance.group_id, -1)
+    forget_post_counts(instance.author_id, instance.group_id)
+
+
+@receiver(post_save, sender=Comment)
+def comment_created(sender, instance, created, **kwargs):
+    if created:
+        bump_user(instance.author_id, comments_count=1)
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    bump_user(instance.author_id, comments_count=-1)
+
+
+@receiver(post_save, sender=Follow)
+def follow_created(sender, instance, created, **kwargs):
+    if created:
+        backfill_feed(instance.user_id, instance.author_id)
+        forget_following(instance.user_id)
+        forget_counts(f'feed:{instance.user_id}')
+        bump_user(instance.author_id, followers_count=1)
+        bump_user(instance.user_id, following_count=1)
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    prune_feed(instance.user_id, instance.author_id)
+    forget_following(instance.user_id)
+    forget_counts(f'feed:{instance.user_id}')
+    bump_user(instance.author_id, followers_count=-1)
+    bump_user(instance.user_id, following_count=-1)
+
+
+def content_changed(sender, **kwargs):
+    bump_content_version()
+
+
+OBJECT_NAMES = {Post: 'post', Group: 'group', User: 'user'}
+
+
+def object_changed(sender, instance, **kwargs):
+    name = OBJECT_NAMES[sender]
+    forget(name, instance.pk)
+    forget_alias(name, instance)
+
+
+for model in (Post, Group, Comment, Follow):
+    post_save.connect(content_changed, sender=model)
+    post_delete.connect(content_changed, sender=model)
+
+for model in OBJECT_NAMES:
+    post_save.connect(object_changed, sender=model)
+    post_delete.connect(object_changed, sender=model)
@@ -0,0 +1,13 @@
+from core.timing import timed
+from django import template
+
+from posts.thumbnails import ready_image
+
+register = template.Library()
+
+
+@register.simple_tag
+def card_image(image):
+    """Варианты картинки карточки, если они уже готовы, иначе None."""
+    with timed('thumbnail'):
+        return ready_image(image)
@@ -0,0 +1,101 @@
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+
+from ..api import BATCH_LIMIT
+from ..models import Comment, Group, Post
+from ..views import COMMENT_COUNT, POST_COUNT
+
+User = get_user_model()
+
+
+class ApiTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='Noname')
+        cls.group_test = Group.objects.create(
+            title='Тестовая группа',
+            slug='test',
+            description='Описание тестовой группы'
+        )
+        cls.posts = [
+            Post.objects.create(
+                text=f'Тестовый пост №{i}',
+                author=cls.user,
+                group=None if i % 2 else cls.group_test,
+            )
+            for i in range(POST_COUNT + 3)
+        ]
+        cls.post_test = cls.posts[0]
+        for i in range(COMMENT_COUNT + 1):
+            Comment.objects.create(
+                text=f'Комментарий №{i}', post=cls.post_test,
+                author=cls.user)
+
+    def test_post_list_pages(self):
+        '''Проверка курсорной пагинации списков постов.'''
+        url = reverse('posts:api_index')
+        with self.assertNumQueries(1):
+            first = self.client.get(url).json()
+        self.assertEqual(len(first['results']), POST_COUNT)
+        self.assertEqual(first['results'][0], {
+            'id': self.posts[-1].pk,
+            'text': self.posts[-1].text,
+            'pub_date': first['results'][0]['pub_date'],
+            'image': None,
+            'username': 'Noname',
+            'group_slug': 'test',
+        })
+        self.assertIsNone(first['previous'])
+        second = self.client.get(url, {'after': first['next']}).json()
+        self.assertEqual(
+            [row['id'] for row in second['results']],
+            [post.pk for post in self.posts[2::-1]])
+        self.assertIsNone(second['next'])
+
+    def test_group_and_profile(self):
+        '''Проверка постов группы и автора.'''
+        group = self.client.get(
+            reverse('posts:api_group_list', args=('test',))).json()
+        self.assertTrue(all(
+            row['group_slug'] == 'test' for row in group['results']))
+        profile = self.client.get(
+            reverse('posts:api_profile', args=('Noname',))).json()
+        self.assertEqual(len(profile['results']), POST_COUNT)
+        response = self.client.get(
+            reverse('posts:api_group_list', args=('missing',)))
+        self.assertEqual(response.status_code, 404)
+        self.assertIn('detail', response.json())
+
+    def test_post_detail_comments(self):
+        '''Проверка поста с курсором по комментариям.'''
+        data = self.client.get(reverse(
+            'posts:api_post_detail', args=(self.post_test.pk,))).json()
+        self.assertEqual(data['post']['id'], self.post_test.pk)
+        comments = data['comments']
+        self.assertEqual(len(comments['results']), COMMENT_COUNT)
+        rest = self.client.get(
+            reverse('posts:api_post_comments', args=(self.post_test.pk,)),
+            {'after': comments['next']}).json()
+        self.assertEqual(
+            [row['text'] for row in rest['results']],
+            [f'Комментарий №{COMMENT_COUNT}'])
+        self.assertIsNone(rest['next'])
+
+    def test_posts_batch(self):
+        '''Проверка пакетной выборки постов по id.'''
+        ids = [self.posts[3].pk, 9999, self.posts[1].pk]
+        with self.assertNumQueries(1):
+            data = self.client.get(
+                reverse('posts:api_posts_batch'),
+                {'ids': ','.join(map(str, ids))}).json()
+        self.assertEqual(
+            [row['id'] for row in data['results']],
+            [self.posts[3].pk, self.posts[1].pk])
+        self.assertEqual(data['missing'], [9999])
+        for ids in ('1,x', ','.join(map(str, range(BATCH_LIMIT + 1)))):
+            with self.subTest(ids=ids[:10]):
+                response = self.client.get(
+                    reverse('posts:api_posts_batch'), {'ids': ids})
+                self.assertEqual(response.status_code, 400)
@@ -0,0 +1,98 @@
+import os
+import tempfile
+from datetime import timedelta
+from io import StringIO
+
+from django.core.management import call_command
+from django.db.models import F
+from django.test import (LiveServerTestCase, SimpleTestCase, TestCase,
+                         override_settings)
+
+from ..benchmark import compare, run, summarize
+from ..models import Comment, FeedEntry, Follow, Post, User, UserStats
+from ..search import search_posts
+from ..seeding import seed
+
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
+
+
+@override_settings(METRICS_TOKEN='benchmark')
+class BenchmarkTest(LiveServerTestCase):
+    def test_seed_and_run(self):
+        '''Проверка загрузки набора данных и прогона нагрузки.'''
+        seed(users=6, groups=2, posts=40, follows=8, comments=20)
+        self.assertEqual(Post.objects.count(), 40)
+        self.assertEqual(
+            FeedEntry.objects.count(),
+            sum(Post.objects.filter(author_id=author_id).count()
+                for author_id in Follow.objects.values_list(
+                    'author_id', flat=True)))
+        self.assertEqual(UserStats.objects.count(), 6)
+        results = run(self.live_server_url, requests=2, concurrency=1)
+        self.assertIn('posts:follow_index', results)
+        for name, result in results.items():
+            with self.subTest(name=name):
+                self.assertEqual(result['errors'], 0)
+                self.assertEqual(result['requests'], 2)
+                self.assertIsNotNone(result['queries'])
+
+
+class CompareTest(SimpleTestCase):
+    def test_summarize(self):
+        '''Проверка перцентилей и пропускной способности.'''
+        result = summarize([n / 1000 for n in range(1, 101)], 0, 2)
+        self.assertEqual(result['p50'], 50)
+        self.assertEqual(result['p95'], 95)
+        self.assertEqual(result['p99'], 99)
+        self.assertEqual(summarize([0.004], 0, 1)['p99'], 4)
+        self.assertEqual(result['rps'], 50)
+
+    def test_compare(self):
+        '''Проверка поиска регрессий относительно базовых результатов.'''
+        baseline = {'posts:main_page': {
+            'p95': 10, 'rps': 100, 'queries': 1, 'errors': 0}}
+        same = {'posts:main_page': {
+            'p95': 11, 'rps': 95, 'queries': 1, 'errors': 0}}
+        worse = {'posts:main_page': {
+            'p95': 20, 'rps': 50, 'queries': 3, 'errors': 1}}
+        self.assertEqual(compare(same, baseline, 0.2), [])
+        self.assertEqual(len(compare(worse, baseline, 0.2)), 4)
+
+
+class SeedTest(TestCase):
+    def test_seed_command(self):
+        '''Проверка команды seed_yatube: неравная популярность авторов,
+        даты постов, картинки и поисковый индекс.'''
+        with tempfile.TemporaryDirectory() as media, \
+                tempfile.TemporaryDirectory() as pool:
+            with open(os.path.join(pool, 'small.gif'), 'wb') as file:
+                file.write(SMALL_GIF)
+            with override_settings(MEDIA_ROOT=media):
+                call_command(
+                    'seed_yatube', users=20, groups=3, posts=300,
+                    follows=50, comments=100, batch=64, images=pool,
+                    image_ratio=0.5, stdout=StringIO())
+        self.assertEqual(Post.objects.count(), 300)
+        self.assertEqual(Comment.objects.count(), 100)
+        authors = list(UserStats.objects.order_by(
+            'user_id').values_list('posts_count', flat=True))
+        self.assertEqual(sum(authors), 300)
+        self.assertGreater(authors[0], authors[-1])
+        dates = list(Post.objects.order_by('id').values_list(
+            'pub_date', flat=True))
+        self.assertEqual(dates, sorted(dates))
+        self.assertGreater(dates[-1] - dates[0], timedelta(days=300))
+        self.assertTrue(Post.objects.exclude(image='').exists())
+        self.assertFalse(Follow.objects.filter(
+            user_id=F('author_id')).exists())
+        self.assertEqual(search_posts('сгенерированный').count(), 300)
+        post = Post.objects.create(
+            text='Новый пост', author=User.objects.first())
+        self.assertEqual(list(search_posts('новый')), [post])
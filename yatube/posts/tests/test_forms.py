@@ -1,12 +1,16 @@
 import tempfile
 from http import HTTPStatus
+from io import BytesIO
 
 from django.contrib.auth import get_user_model
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.test import Client, TestCase, override_settings
+from django.core.files.uploadhandler import StopUpload
+from django.test import Client, RequestFactory, TestCase, override_settings
 from django.urls import reverse
+from PIL import Image
 
 from ..models import Comment, Group, Post
+from ..uploads import BoundedUploadHandler
 
 User = get_user_model()
 
@@ -140,3 +144,87 @@ class PostCreateExistTest(TestCase):
         self.assertEqual(post.text, form_fields['text'])
         self.assertEqual(post.author.username, username)
         self.assertEqual(post.group, self.group_test)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class PostImageValidationTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='Noname')
+        cls.authorized_client = Client()
+        cls.authorized_client.force_login(cls.user)
+        cls.small_gif = (
+            b'\x47\x49\x46\x38\x39\x61\x02\x00'
+            b'\x01\x00\x80\x00\x00\x00\x00\x00'
+            b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+            b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+            b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+            b'\x0A\x00\x3B'
+        )
+
+    def post_image(self, content):
+        uploaded = SimpleUploadedFile(
+            name='small.gif',
+            content=content,
+            content_type='image/gif',
+        )
+        return self.authorized_client.post(
+            reverse('posts:create_post'),
+            data={'text': 'Тестовый текст', 'image': uploaded}
+        )
+
+    def assert_rejected(self, response, code):
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        errors = response.context['form'].errors.as_data()['image']
+        self.assertEqual(errors[0].code, code)
+        self.assertFalse(Post.objects.exists())
+
+    @override_settings(POST_IMAGE_MAX_BYTES=16)
+    def test_oversized_file_rejected(self):
+        '''Проверка, что слишком большой файл отклоняется'''
+        self.assert_rejected(self.post_image(self.small_gif), 'too_large')
+
+    @override_settings(POST_IMAGE_MAX_BYTES=16)
+    def test_oversized_upload_stopped(self):
+        '''Проверка, что загрузка сверх лимита обрывается без дочитывания'''
+        request = RequestFactory().post('/')
+        handler = BoundedUploadHandler(request)
+        handler.new_file('image', 'small.gif', 'image/gif', None)
+        handler.receive_data_chunk(self.small_gif[:16], 0)
+        with self.assertRaises(StopUpload) as stop:
+            handler.receive_data_chunk(self.small_gif[16:], 16)
+        self.assertTrue(stop.exception.connection_reset)
+        self.assertEqual(request.oversized_upload, 'image')
+        handler.file.close()
+
+    @override_settings(POST_IMAGE_MAX_PIXELS=1)
+    def test_too_many_pixels_rejected(self):
+        '''Проверка, что размеры картинки проверяются по заголовку'''
+        self.assert_rejected(
+            self.post_image(self.small_gif), 'too_many_pixels')
+
+    @override_settings(POST_IMAGE_FORMATS=('JPEG',))
+    def test_format_rejected(self):
+        '''Проверка, что неразрешённый формат отклоняется'''
+        self.assert_rejected(self.post_image(self.small_gif), 'bad_format')
+
+    @override_settings(POST_IMAGE_FORMATS=('JPEG',))
+    def test_mpo_accepted_as_jpeg(self):
+        '''Проверка, что JPEG с камеры телефона (MPO) принимается'''
+        content = BytesIO()
+        Image.new('RGB', (2, 2)).save(
+            content, 'MPO', save_all=True,
+            append_images=[Image.new('RGB', (2, 2))])
+        self.post_image(content.getvalue())
+        self.assertTrue(Post.objects.exclude(image='').exists())
+
+    def test_not_image_rejected(self):
+        '''Проверка, что файл не-картинка отклоняется'''
+        self.assert_rejected(
+            self.post_image(b'not an image at all'), 'invalid_image')
+
+    def test_valid_image_accepted(self):
+        '''Проверка, что корректная картинка сохраняется'''
+        self.post_image(self.small_gif)
+        self.assertTrue(Post.objects.exclude(image='').exists())
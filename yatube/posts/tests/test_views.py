@@ -1,15 +1,36 @@
+import os
+import shutil
+import tempfile
+import time
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
 from django import forms
 from django.contrib.auth import get_user_model
 from django.core.cache import cache
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.test import Client, TestCase
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.db.migrations.loader import MigrationLoader
+from django.db.migrations.writer import MigrationWriter
+from django.http import Http404
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
-from ..models import Comment, Follow, Group, Post
-from ..views import POST_COUNT
+from .. import objects
+from ..caching import CONTENT_CHANGED_KEY
+from ..counters import count_key
+from ..models import Comment, FeedEntry, Follow, Group, Post
+from ..query_plans import index_migration, missing_indexes, plan_problems
+from ..thumbnails import generate_image, ready_image
+from ..utils import encode_cursor
+from ..views import COMMENT_COUNT, POST_COUNT
 
 User = get_user_model()
 POSTS_FOR_TEST = 13
+TEMP_MEDIA_ROOT = tempfile.mkdtemp()
 
 
 class CommentCreateExistTest(TestCase):
@@ -38,6 +59,7 @@ class CommentCreateExistTest(TestCase):
         self.assertEqual(first_objects.author, self.comment_test.author)
 
 
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
 class PostPagesTest(TestCase):
     @classmethod
     def setUpClass(cls):
@@ -186,22 +208,64 @@ class PostPagesTest(TestCase):
             self.assertEqual(first.text, post_text)
 
     def test_cache_main_page(self):
-        '''Проверка, что главная страница отдаёт кэшированные данные'''
+        '''Проверка, что главная страница отдаёт кэшированные данные
+        до первого изменения контента'''
         cache.clear()
         response_1 = self.authorized_client.get(reverse('posts:main_page'))
         count_1 = len(response_1.context['page_obj'])
+        # update() не шлёт сигналов, поколение контента не меняется.
+        Post.objects.filter(pk=self.post_test.pk).update(text='Новый текст')
+        response_2 = self.authorized_client.get(reverse('posts:main_page'))
+        self.assertEqual(response_1.content, response_2.content)
         Post.objects.create(
             text='Тестовый текст',
             group=self.group_test,
             author=self.user
         )
-        response_2 = self.authorized_client.get(reverse('posts:main_page'))
-        self.assertEqual(response_1.content, response_2.content)
-        cache.clear()
         response_3 = self.authorized_client.get(reverse('posts:main_page'))
         count_3 = len(response_3.context['page_obj'])
         self.assertEqual(count_3, count_1 + 1)
 
+    def test_post_card_cache(self):
+        '''Проверка, что карточка поста кэшируется до изменения поста,
+        его автора или группы'''
+        cache.clear()
+        Follow.objects.create(user=self.user, author=self.user)
+        url = reverse('posts:follow_index')
+        self.authorized_client.get(url)
+        Post.objects.filter(pk=self.post_test.pk).update(text='Новый текст')
+        self.assertNotContains(self.authorized_client.get(url), 'Новый текст')
+        group = Group.objects.get(pk=self.group_test.pk)
+        group.title = 'Новая группа'
+        group.save()
+        response = self.authorized_client.get(url)
+        self.assertContains(response, 'Новый текст')
+        self.assertContains(response, 'Новая группа')
+        post = Post.objects.get(pk=self.post_test.pk)
+        post.text = 'Правка поста'
+        post.save()
+        self.assertContains(self.authorized_client.get(url), 'Правка поста')
+
+    def test_cache_invalidated_on_write(self):
+        '''Проверка, что страницы группы и профиля обновляются
+        сразу после изменения контента'''
+        cache.clear()
+        pages = [
+            reverse('posts:group_list', kwargs={'slug': self.group_test.slug}),
+            reverse('posts:profile', kwargs={'username': self.user.username}),
+        ]
+        before = [self.authorized_client.get(page).content for page in pages]
+        post = Post.objects.create(
+            text='Свежий пост',
+            group=self.group_test,
+            author=self.user
+        )
+        for page, content in zip(pages, before):
+            with self.subTest(page=page):
+                response = self.authorized_client.get(page)
+                self.assertNotEqual(response.content, content)
+                self.assertContains(response, post.text)
+
 
 class PaginatorViewsTest(TestCase):
     @classmethod
@@ -254,9 +318,120 @@ class PaginatorViewsTest(TestCase):
         if count > POST_COUNT:
             count = POST_COUNT
         for page in page_list:
-            response = self.authorized_client.get(page + '?page=2')
+            response = self.authorized_client.get(page)
+            cursor = response.context['page_obj'].paginator.next_cursor
+            response = self.authorized_client.get(page + f'?after={cursor}')
             self.assertEqual(len(response.context['page_obj']), count)
 
+    def test_previous_page(self):
+        '''Проверка возврата на предыдущую страницу паджинатора.'''
+        cache.clear()
+        page = reverse('posts:main_page')
+        first = self.authorized_client.get(page).context['page_obj']
+        cursor = first.paginator.next_cursor
+        second = self.authorized_client.get(
+            page + f'?after={cursor}').context['page_obj']
+        self.assertTrue(second.has_previous())
+        self.assertFalse(second.has_next())
+        cursor = second.paginator.previous_cursor
+        response = self.authorized_client.get(page + f'?before={cursor}')
+        self.assertEqual(
+            list(response.context['page_obj']), list(first)
+        )
+
+    def test_cursor_of_other_type(self):
+        '''Проверка, что курсор с ключом другого типа считается битым.'''
+        cache.clear()
+        pages = (
+            (reverse('posts:main_page'), {}, encode_cursor(1.5, 3)),
+            (reverse('posts:search'), {'q': 'пост'},
+             encode_cursor(Post.objects.first().pub_date, 3)),
+        )
+        for page, params, cursor in pages:
+            for direction in ('after', 'before'):
+                with self.subTest(page=page, direction=direction):
+                    response = self.authorized_client.get(
+                        page, {**params, direction: cursor})
+                    self.assertEqual(response.status_code, 200)
+                    self.assertFalse(
+                        response.context['page_obj'].has_previous())
+
+
+@override_settings(POSTS_PAGINATION='offset')
+class OffsetPaginationTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='Noname')  # type: ignore
+        cls.group_test = Group.objects.create(
+            title='Тестовая группа',
+            slug='test',
+            description='Описание тестовой группы'
+        )
+        Post.objects.bulk_create(
+            Post(text=f'Пост №{i}', author=cls.user, group=cls.group_test)
+            for i in range(POST_COUNT * 20)
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def test_windowed_page_range(self):
+        '''Проверка, что выводятся только страницы вокруг текущей
+        и по краям.'''
+        response = self.client.get(reverse('posts:main_page') + '?page=10')
+        self.assertEqual(response.context['page_obj'].number, 10)
+        for number in (1, 8, 9, 11, 12, 20):
+            with self.subTest(number=number):
+                self.assertContains(response, f'?page={number}"')
+        for number in (2, 7, 13, 19):
+            with self.subTest(number=number):
+                self.assertNotContains(response, f'?page={number}"')
+        self.assertContains(response, '&hellip;', count=2)
+
+    def test_cached_counts(self):
+        '''Проверка, что число постов области берётся из кэша
+        и сбрасывается при записи.'''
+        pages = {
+            'all': reverse('posts:main_page'),
+            f'group:{self.group_test.pk}': reverse(
+                'posts:group_list', kwargs={'slug': self.group_test.slug}),
+            f'author:{self.user.pk}': reverse(
+                'posts:profile', kwargs={'username': self.user.username}),
+        }
+        for scope, page in pages.items():
+            with self.subTest(scope=scope):
+                self.client.get(page)
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.client.get(page + '?page=2')
+                self.assertEqual(response.context['page_obj'].number, 2)
+                self.assertFalse(any(
+                    'COUNT(' in query['sql'] for query in queries))
+        Post.objects.create(
+            text='Новый пост', author=self.user, group=self.group_test)
+        for scope in pages:
+            with self.subTest(scope=scope):
+                self.assertIsNone(cache.get(count_key(scope)))
+
+    @override_settings(POSTS_PAGINATION='offset')
+    def test_feed_count_forgotten(self):
+        '''Проверка, что число постов ленты сбрасывается при постах
+        и удалениях автора подписки.'''
+        reader = User.objects.create_user(username='Reader')
+        Follow.objects.create(user=reader, author=self.user)
+        self.client.force_login(reader)
+        url = reverse('posts:follow_index')
+        scope = f'feed:{reader.pk}'
+        self.client.get(url)
+        self.assertIsNotNone(cache.get(count_key(scope)))
+        post = Post.objects.create(text='Новый пост', author=self.user)
+        self.assertIsNone(cache.get(count_key(scope)))
+        response = self.client.get(url)
+        self.assertEqual(
+            response.context['page_obj'].paginator.count, POST_COUNT * 20 + 1)
+        post.delete()
+        self.assertIsNone(cache.get(count_key(scope)))
+
 
 class TestFollow(TestCase):
     @classmethod
@@ -322,6 +497,34 @@ class TestFollow(TestCase):
         first = response.context['page_obj'][0]
         self.assertEqual(new_post.text, first.text)
 
+    @override_settings(FEED_FANOUT_BATCH=2)
+    def test_fan_out_in_batches(self):
+        '''Проверка, что пост попадает в ленты всех подписчиков
+        при раскладке пачками'''
+        followers = [
+            User.objects.create(username=f'Follower_{i}') for i in range(5)
+        ]
+        for follower in followers:
+            Follow.objects.create(user=follower, author=self.user_3)
+        new_post = Post.objects.create(
+            text='Тестовый пост контент',
+            author=self.user_3
+        )
+        self.assertEqual(
+            FeedEntry.objects.filter(post=new_post).count(), len(followers)
+        )
+
+    def test_unfollow_prunes_feed(self):
+        '''Проверка, что после отписки посты автора уходят из ленты'''
+        self.assertTrue(FeedEntry.objects.filter(
+            user=self.user_1, post=self.post_test).exists())
+        self.authorized_client_1.get(reverse(
+            'posts:profile_unfollow',
+            kwargs={'username': self.user_2.username}
+        ))
+        self.assertFalse(FeedEntry.objects.filter(
+            user=self.user_1, post__author=self.user_2).exists())
+
     def test_not_add_post_in_unfollower(self):
         '''Проверка, что пост не появился у тех, кто не подписан'''
         posts = Post.objects.filter(author=self.user_2).count()
@@ -333,3 +536,589 @@ class TestFollow(TestCase):
         response = self.authorized_client_1.get(reverse('posts:follow_index'))
         count_posts = len(response.context['page_obj'])
         self.assertEqual(count_posts, posts)
+
+
+class QueryCountTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.guest_client = Client()
+        cls.group_test = Group.objects.create(
+            title='Тестовая группа',
+            slug='test',
+            description='Описание тестовой группы'
+        )
+        cls.follower = User.objects.create_user(username='Follower')
+        cls.authorized_client = Client()
+        cls.authorized_client.force_login(cls.follower)
+        for i in range(POST_COUNT):
+            author = User.objects.create_user(username=f'Author_{i}')
+            Follow.objects.create(user=cls.follower, author=author)
+            Post.objects.create(
+                text=f'Тестовый пост контент №{i}',
+                group=cls.group_test,
+                author=author,
+            )
+
+    def test_list_pages_query_budget(self):
+        '''Проверка, что число запросов списка не зависит от числа постов.'''
+        cache.clear()
+        pages = {
+            reverse('posts:main_page'): 1,
+            reverse('posts:group_list', kwargs={'slug': 'test'}): 2,
+            reverse('posts:profile', kwargs={'username': 'Author_0'}): 3,
+        }
+        for page, queries in pages.items():
+            with self.subTest(page=page):
+                with self.assertNumQueries(queries):
+                    response = self.guest_client.get(page)
+                self.assertEqual(response.status_code, 200)
+
+    def test_follow_page_query_budget(self):
+        '''Проверка числа запросов ленты подписок.'''
+        with self.assertNumQueries(3):
+            response = self.authorized_client.get(
+                reverse('posts:follow_index'))
+        self.assertEqual(len(response.context['page_obj']), POST_COUNT)
+
+
+class ConditionalGetTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='Noname')
+        cls.group_test = Group.objects.create(
+            title='Тестовая группа',
+            slug='test',
+            description='Описание тестовой группы'
+        )
+        cls.post_test = Post.objects.create(
+            text='Тестовый пост контент',
+            group=cls.group_test,
+            author=cls.user,
+        )
+        cls.pages = [
+            reverse('posts:main_page'),
+            reverse('posts:group_list', args=('test',)),
+            reverse('posts:profile', args=('Noname',)),
+            reverse('posts:post_detail', args=(cls.post_test.pk,)),
+        ]
+
+    def setUp(self):
+        cache.clear()
+        # Last-Modified отдаётся, только когда секунда записи прошла.
+        cache.set(CONTENT_CHANGED_KEY, time.time() - 2, None)
+
+    def test_not_modified_without_queries(self):
+        '''Проверка ответа 304 по ETag и Last-Modified без запросов к БД.'''
+        for page in self.pages:
+            with self.subTest(page=page):
+                response = self.client.get(page)
+                etag = response['ETag']
+                last_modified = response['Last-Modified']
+                with self.assertNumQueries(0):
+                    response = self.client.get(
+                        page, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 304)
+                response = self.client.get(
+                    page, HTTP_IF_MODIFIED_SINCE=last_modified)
+                self.assertEqual(response.status_code, 304)
+
+    def test_modified_after_write(self):
+        '''Проверка, что после записи страница отдаётся заново.'''
+        etag = self.client.get(self.pages[0])['ETag']
+        Post.objects.create(text='Новый пост', author=self.user)
+        response = self.client.get(self.pages[0], HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Новый пост')
+
+    def test_validators_depend_on_session(self):
+        '''Проверка, что ETag гостя не подходит пользователю с сессией.'''
+        etag = self.client.get(self.pages[0])['ETag']
+        self.client.force_login(self.user)
+        response = self.client.get(self.pages[0], HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertFalse(response.has_header('Last-Modified'))
+
+    def test_client_revalidates(self):
+        '''Проверка, что браузер не хранит страницу без сверки с сервером
+        и что пользователь не получает закэшированную страницу гостя.'''
+        self.client.get(self.pages[0])
+        response = self.client.get(self.pages[0])
+        for directive in ('no-cache', 'max-age=0', 'private'):
+            with self.subTest(directive=directive):
+                self.assertIn(directive, response['Cache-Control'])
+        self.client.force_login(self.user)
+        response = self.client.get(self.pages[0])
+        self.assertContains(response, reverse('users:logout'))
+
+    def test_stale_page_without_validators(self):
+        '''Проверка, что прежнее поколение страницы, отданное во время
+        чужого пересчёта, уходит без ETag и Last-Modified.'''
+        for _ in range(2):
+            self.client.get(self.pages[0])
+        Post.objects.create(text='Новый пост', author=self.user)
+        cache.set(CONTENT_CHANGED_KEY, time.time() - 2, None)
+        with mock.patch.object(cache, 'add', return_value=False):
+            response = self.client.get(self.pages[0])
+        self.assertNotContains(response, 'Новый пост')
+        self.assertFalse(response.has_header('ETag'))
+        self.assertFalse(response.has_header('Last-Modified'))
+        response = self.client.get(self.pages[0])
+        self.assertContains(response, 'Новый пост')
+        self.assertTrue(response.has_header('ETag'))
+
+    def test_validators_depend_on_page(self):
+        '''Проверка, что ETag одной страницы не подходит другой.'''
+        etag = self.client.get(self.pages[0])['ETag']
+        response = self.client.get(self.pages[1], HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_no_last_modified_in_write_second(self):
+        '''Проверка, что в секунду записи Last-Modified не отдаётся.'''
+        Post.objects.create(text='Новый пост', author=self.user)
+        response = self.client.get(self.pages[0])
+        self.assertFalse(response.has_header('Last-Modified'))
+        self.assertTrue(response.has_header('ETag'))
+
+
+class QueryPlanAuditTest(TestCase):
+    def test_no_plan_regressions(self):
+        '''Проверка, что планы запросов не хуже базового отчёта.'''
+        out = StringIO()
+        call_command('audit_queries', stdout=out)
+        self.assertIn('Новых проблем нет', out.getvalue())
+        self.assertIn('Рекомендованные индексы уже есть', out.getvalue())
+        self.assertFalse(User.objects.filter(
+            username__startswith='query_audit').exists())
+
+    def test_regression_fails(self):
+        '''Проверка, что находки вне базового отчёта роняют команду.'''
+        with tempfile.TemporaryDirectory() as directory:
+            with self.assertRaisesMessage(
+                    CommandError, 'posts:create_post scan posts_group'):
+                call_command(
+                    'audit_queries', stdout=StringIO(),
+                    baseline=os.path.join(directory, 'baseline.json'))
+
+    def test_missing_index_migration(self):
+        '''Проверка миграции с недостающими рекомендованными индексами.'''
+        loader = MigrationLoader(None, ignore_no_migrations=True)
+        self.assertIsNone(index_migration(loader))
+        state = loader.project_state()
+        state.models['posts', 'comment'].options['indexes'] = []
+        state.models['posts', 'follow'].options['constraints'] = []
+        operations = missing_indexes(state)
+        self.assertEqual(
+            [(operation.model_name, operation.index.fields)
+             for operation in operations],
+            [('comment', ['post', 'created']), ('follow', ['user'])])
+        with mock.patch.object(loader, 'project_state', return_value=state):
+            migration = index_migration(loader)
+        self.assertEqual(
+            migration.dependencies,
+            [max(loader.graph.leaf_nodes('posts'))])
+        self.assertIn('comment_post_created_idx',
+                      MigrationWriter(migration).as_string())
+
+    def test_plan_problems(self):
+        '''Проверка разбора плана SQLite.'''
+        plan = [
+            'SCAN posts_post',
+            'SEARCH auth_user USING INTEGER PRIMARY KEY (rowid=?)',
+            'SCAN posts_group USING INDEX post_pub_date_idx',
+            'USE TEMP B-TREE FOR ORDER BY',
+        ]
+        sql = 'SELECT (SELECT 1 FROM x) FROM "posts_post" ORDER BY id'
+        self.assertEqual(list(plan_problems(sql, plan)), [
+            ('scan', 'posts_post'), ('temp_btree', 'posts_post')])
+
+
+class CommentBatchTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='Noname')
+        cls.post_test = Post.objects.create(
+            text='Популярный пост', author=cls.author)
+        for i in range(COMMENT_COUNT + 5):
+            Comment.objects.create(
+                text=f'Комментарий №{i}', post=cls.post_test,
+                author=User.objects.create_user(username=f'Reader_{i}'))
+
+    def test_first_batch_inline(self):
+        '''Проверка, что пост выводит первую пачку комментариев
+        без запроса на каждого автора.'''
+        url = reverse('posts:post_detail', args=(self.post_test.pk,))
+        with self.assertNumQueries(2):
+            response = self.client.get(url)
+        comments = response.context['comments']
+        self.assertEqual(len(comments), COMMENT_COUNT)
+        self.assertEqual(comments[0].text, 'Комментарий №0')
+        self.assertContains(response, reverse(
+            'posts:post_comments', args=(self.post_test.pk,)))
+
+    def test_next_batch_fragment(self):
+        '''Проверка фрагмента со следующей пачкой комментариев.'''
+        first = self.client.get(reverse(
+            'posts:post_detail', args=(self.post_test.pk,)))
+        response = self.client.get(
+            reverse('posts:post_comments', args=(self.post_test.pk,)),
+            {'after': first.context['next_cursor']})
+        self.assertTemplateNotUsed(response, 'base.html')
+        texts = [comment.text for comment in response.context['comments']]
+        self.assertEqual(texts, [
+            f'Комментарий №{i}'
+            for i in range(COMMENT_COUNT, COMMENT_COUNT + 5)
+        ])
+        self.assertIsNone(response.context['next_cursor'])
+        self.assertNotContains(response, 'Показать ещё')
+
+
+@override_settings(FOLLOW_FEED_MODE='read')
+class TestFollowReadMode(TestFollow):
+    def setUp(self):
+        cache.clear()
+
+    def test_merged_feed_order(self):
+        '''Проверка порядка и пагинации ленты, собранной слиянием'''
+        Follow.objects.create(user=self.user_1, author=self.user_3)
+        for i in range(POST_COUNT):
+            Post.objects.create(
+                text=f'Тестовый пост №{i}',
+                author=self.user_2 if i % 2 else self.user_3
+            )
+        expected = list(Post.objects.filter(
+            author__in=(self.user_2, self.user_3)))
+        url = reverse('posts:follow_index')
+        first = self.authorized_client_1.get(url).context['page_obj']
+        self.assertEqual(list(first), expected[:POST_COUNT])
+        cursor = first.paginator.next_cursor
+        second = self.authorized_client_1.get(
+            url + f'?after={cursor}').context['page_obj']
+        self.assertEqual(list(second), expected[POST_COUNT:])
+
+    @override_settings(FEED_RECENT_POSTS=2)
+    def test_window_fallback(self):
+        '''Проверка, что за пределами кэша лента строится из базы'''
+        for i in range(3):
+            Post.objects.create(text=f'Тестовый пост №{i}', author=self.user_2)
+        response = self.authorized_client_1.get(reverse('posts:follow_index'))
+        self.assertEqual(len(response.context['page_obj']), 4)
+
+    @override_settings(FEED_RECENT_POSTS=2)
+    def test_window_after_delete(self):
+        '''Проверка, что удаление поста не обрезает ленту по кэшу'''
+        posts = [
+            Post.objects.create(text=f'Тестовый пост №{i}', author=self.user_2)
+            for i in range(3)
+        ]
+        url = reverse('posts:follow_index')
+        self.authorized_client_1.get(url)
+        posts[-1].delete()
+        response = self.authorized_client_1.get(url)
+        self.assertEqual(len(response.context['page_obj']), 3)
+
+
+class CountersTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='Author')
+        cls.reader = User.objects.create_user(username='Reader')
+        cls.author_client = Client()
+        cls.author_client.force_login(cls.author)
+        cls.reader_client = Client()
+        cls.reader_client.force_login(cls.reader)
+        cls.group_test = Group.objects.create(
+            title='Тестовая группа',
+            slug='test',
+            description='Описание тестовой группы'
+        )
+        cls.group_test_2 = Group.objects.create(
+            title='Тестовая группа 2',
+            slug='test2',
+            description='Описание тестовой группы 2'
+        )
+
+    def stats(self, user):
+        user.stats.refresh_from_db()
+        return user.stats
+
+    def test_post_counters(self):
+        '''Проверка счётчиков постов при создании, правке и удалении'''
+        self.author_client.post(reverse('posts:create_post'), data={
+            'text': 'Тестовый текст', 'group': self.group_test.pk})
+        post = Post.objects.get(author=self.author)
+        self.assertEqual(self.stats(self.author).posts_count, 1)
+        self.group_test.refresh_from_db()
+        self.assertEqual(self.group_test.posts_count, 1)
+        self.author_client.post(
+            reverse('posts:post_edit', kwargs={'post_id': post.pk}),
+            data={'text': 'Тестовый текст', 'group': self.group_test_2.pk})
+        self.group_test.refresh_from_db()
+        self.group_test_2.refresh_from_db()
+        self.assertEqual(self.group_test.posts_count, 0)
+        self.assertEqual(self.group_test_2.posts_count, 1)
+        self.author_client.get(
+            reverse('posts:post_delete', kwargs={'post_id': post.pk}))
+        self.assertEqual(self.stats(self.author).posts_count, 0)
+        self.group_test_2.refresh_from_db()
+        self.assertEqual(self.group_test_2.posts_count, 0)
+
+    def test_comment_and_follow_counters(self):
+        '''Проверка счётчиков комментариев и подписок'''
+        post = Post.objects.create(text='Тестовый текст', author=self.author)
+        self.reader_client.post(
+            reverse('posts:add_comment', kwargs={'post_id': post.pk}),
+            data={'text': 'Тестовый комментарий'})
+        self.assertEqual(self.stats(self.reader).comments_count, 1)
+        follow = reverse('posts:profile_follow', kwargs={'username': 'Author'})
+        self.reader_client.get(follow)
+        self.assertEqual(self.stats(self.author).followers_count, 1)
+        self.assertEqual(self.stats(self.reader).following_count, 1)
+        self.reader_client.get(reverse(
+            'posts:profile_unfollow', kwargs={'username': 'Author'}))
+        self.assertEqual(self.stats(self.author).followers_count, 0)
+        self.assertEqual(self.stats(self.reader).following_count, 0)
+
+    def test_recount_stats_repairs_drift(self):
+        '''Проверка, что recount_stats исправляет разошедшиеся счётчики'''
+        Post.objects.bulk_create([
+            Post(text='Тестовый текст', author=self.author,
+                 group=self.group_test)
+        ])
+        self.assertEqual(self.stats(self.author).posts_count, 0)
+        call_command('recount_stats', stdout=StringIO())
+        self.assertEqual(self.stats(self.author).posts_count, 1)
+        self.group_test.refresh_from_db()
+        self.assertEqual(self.group_test.posts_count, 1)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ThumbnailTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='Noname')
+        small_gif = (
+            b'\x47\x49\x46\x38\x39\x61\x02\x00'
+            b'\x01\x00\x80\x00\x00\x00\x00\x00'
+            b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+            b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+            b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+            b'\x0A\x00\x3B'
+        )
+        cls.post_test = Post.objects.create(
+            text='Тестовый пост контент',
+            author=cls.user,
+            image=SimpleUploadedFile(
+                name='small.gif',
+                content=small_gif,
+                content_type='image/gif'
+            )
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def test_placeholder_until_thumbnail_ready(self):
+        '''Проверка, что до генерации миниатюры выводится заглушка'''
+        cache.clear()
+        url = reverse(
+            'posts:post_detail', kwargs={'post_id': self.post_test.pk})
+        self.assertIsNone(ready_image(self.post_test.image))
+        response = self.client.get(url)
+        self.assertContains(response, 'aspect-ratio')
+        self.assertNotContains(response, '<picture>')
+        generate_image(self.post_test.image.name)
+        variants = ready_image(self.post_test.image)
+        self.assertIsNotNone(variants)
+        self.assertTrue(variants['placeholder'].startswith('data:image/'))
+        response = self.client.get(reverse('posts:main_page'))
+        self.assertContains(response, variants['src'])
+        self.assertContains(response, variants['webp_srcset'])
+        self.assertContains(response, 'loading="lazy"')
+
+
+class SearchTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='Noname')
+        cls.admin = User.objects.create_superuser(
+            username='Admin', email='admin@yatube.ru', password='password')
+        for i in range(POSTS_FOR_TEST):
+            Post.objects.create(text=f'Тестовый пост про котов №{i}',
+                                author=cls.user)
+        cls.best = Post.objects.create(
+            text='Коты, коты и ещё раз коты', author=cls.user)
+        cls.other = Post.objects.create(
+            text='Пост про собак', author=cls.user)
+
+    def test_search_ranked(self):
+        '''Проверка, что поиск находит посты и ставит лучший первым'''
+        response = self.client.get(reverse('posts:search'), {'q': 'коты'})
+        page_obj = response.context['page_obj']
+        self.assertEqual(page_obj[0], self.best)
+        self.assertNotIn(self.other, page_obj)
+
+    def test_empty_query(self):
+        '''Проверка страницы поиска без запроса и с запросом без слов'''
+        for params in ({}, {'q': ''}, {'q': '!!'}):
+            with self.subTest(params=params):
+                response = self.client.get(reverse('posts:search'), params)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(len(response.context['page_obj']), 0)
+
+    @override_settings(POSTS_PAGINATION='offset')
+    def test_search_ranked_offset(self):
+        '''Проверка, что с номерами страниц поиск тоже идёт по рангу'''
+        Post.objects.filter(pk=self.best.pk).update(
+            pub_date=self.best.pub_date - timedelta(days=1))
+        response = self.client.get(reverse('posts:search'), {'q': 'кот'})
+        page_obj = response.context['page_obj']
+        self.assertEqual(page_obj[0], self.best)
+        self.assertEqual(page_obj.paginator.count, POSTS_FOR_TEST + 1)
+
+    def test_search_pagination(self):
+        '''Проверка курсорной пагинации результатов поиска'''
+        url = reverse('posts:search')
+        first = self.client.get(url, {'q': 'кот'}).context['page_obj']
+        self.assertEqual(len(first), POST_COUNT)
+        response = self.client.get(url, {
+            'q': 'кот', 'after': first.paginator.next_cursor})
+        second = response.context['page_obj']
+        found = list(first) + list(second)
+        self.assertEqual(len(found), POSTS_FOR_TEST + 1)
+        self.assertEqual(len(set(found)), len(found))
+
+    def test_search_index_follows_edits(self):
+        '''Проверка, что индекс обновляется при правке и удалении'''
+        url = reverse('posts:search')
+        Post.objects.filter(pk=self.other.pk).update(text='Пост про енотов')
+        found = self.client.get(url, {'q': 'енотов'}).context['page_obj']
+        self.assertEqual(list(found), [self.other])
+        self.other.delete()
+        found = self.client.get(url, {'q': 'енотов'}).context['page_obj']
+        self.assertEqual(len(found), 0)
+
+    def test_admin_search(self):
+        '''Проверка, что поиск в админке использует индекс'''
+        self.client.force_login(self.admin)
+        response = self.client.get(
+            reverse('admin:posts_post_changelist'), {'q': 'собак'})
+        self.assertEqual(
+            list(response.context['cl'].result_list), [self.other])
+
+
+class ObjectCacheTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='Noname')
+        cls.group_test = Group.objects.create(
+            title='Тестовая группа',
+            slug='test',
+            description='Описание тестовой группы'
+        )
+        cls.posts = [
+            Post.objects.create(text=f'Пост №{i}', author=cls.user,
+                                group=cls.group_test)
+            for i in range(3)
+        ]
+
+    def setUp(self):
+        cache.clear()
+
+    def test_lookup_cached(self):
+        '''Проверка, что повторный поиск не обращается к базе'''
+        objects.group_or_404(None, 'test')
+        objects.user_or_404(None, 'Noname')
+        with self.assertNumQueries(0):
+            group = objects.group_or_404(None, 'test')
+            user = objects.user_or_404(None, 'Noname')
+        self.assertEqual(group, self.group_test)
+        self.assertEqual(user.stats.posts_count, 3)
+
+    def test_post_with_related(self):
+        '''Проверка, что промах по посту кэширует автора и группу'''
+        post = self.posts[0]
+        with self.assertNumQueries(1):
+            objects.post_or_404(None, post.pk)
+        with self.assertNumQueries(0):
+            found = objects.post_or_404(None, str(post.pk))
+            self.assertEqual(found.author, self.user)
+            self.assertEqual(found.group, self.group_test)
+
+    def test_get_many_batch(self):
+        '''Проверка пакетного чтения постов в заданном порядке'''
+        pks = [post.pk for post in reversed(self.posts)]
+        objects.posts(pks[:1])
+        with self.assertNumQueries(1):
+            found = objects.posts(pks + [0])
+        self.assertEqual(found, list(reversed(self.posts)))
+
+    def test_request_memo(self):
+        '''Проверка, что внутри запроса объект читается один раз'''
+        request = Client().get(reverse('posts:main_page')).wsgi_request
+        objects.group_or_404(request, 'test')
+        cache.clear()
+        with self.assertNumQueries(0):
+            objects.get('group', self.group_test.pk, request)
+
+    def test_invalidated_on_save(self):
+        '''Проверка, что правка и удаление сбрасывают кэш объекта'''
+        objects.group_or_404(None, 'test')
+        group = Group.objects.get(slug='test')
+        group.title = 'Новое название'
+        group.save()
+        group = objects.group_or_404(None, 'test')
+        self.assertEqual(group.title, 'Новое название')
+        post = Post.objects.get(pk=self.posts[0].pk)
+        objects.post_or_404(None, post.pk)
+        post.delete()
+        with self.assertRaises(Http404):
+            objects.post_or_404(None, post.pk)
+
+    def test_missing_cached(self):
+        '''Проверка, что отсутствие объекта кэшируется до его создания'''
+        urls = (
+            reverse('posts:group_list', kwargs={'slug': 'new'}),
+            reverse('posts:profile', kwargs={'username': 'Nobody'}),
+            reverse('posts:post_detail', kwargs={'post_id': 10 ** 9}),
+        )
+        for url in urls:
+            self.assertEqual(self.client.get(url).status_code, 404)
+        with self.assertNumQueries(0):
+            for url in urls:
+                with self.subTest(url=url):
+                    self.assertEqual(self.client.get(url).status_code, 404)
+        Group.objects.create(title='Новая группа', slug='new')
+        self.assertEqual(self.client.get(urls[0]).status_code, 200)
+
+    def test_recount_forgets(self):
+        '''Проверка, что recount_stats сбрасывает кэш счётчиков'''
+        objects.user_or_404(None, 'Noname')
+        objects.group_or_404(None, 'test')
+        Post.objects.bulk_create([
+            Post(text='Тестовый текст', author=self.user,
+                 group=self.group_test)
+        ])
+        call_command('recount_stats', stdout=StringIO())
+        user = objects.user_or_404(None, 'Noname')
+        self.assertEqual(user.stats.posts_count, 4)
+        group = objects.group_or_404(None, 'test')
+        self.assertEqual(group.posts_count, 4)
+
+    def test_user_public_fields(self):
+        '''Проверка, что в кэш не попадают пароль и почта'''
+        post = objects.post_or_404(None, self.posts[0].pk)
+        user = objects.user_or_404(None, 'Noname')
+        for cached in (post.author, user):
+            with self.subTest(cached=cached):
+                self.assertTrue({'password', 'email'}
+                                <= cached.get_deferred_fields())
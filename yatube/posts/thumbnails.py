@@ -0,0 +1,136 @@
+import base64
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from core import metrics
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from sorl.thumbnail import get_thumbnail
+
+from .caching import bump_content_version
+
+logger = logging.getLogger(__name__)
+
+# Картинка карточки поста: кадрирование 960x339 по центру,
+# варианты нескольких ширин в WebP и JPEG плюс размытая LQIP-заглушка.
+CARD_WIDTH = 960
+CARD_HEIGHT = 339
+CARD_OPTIONS = {'crop': 'center', 'upscale': True}
+VARIANT_WIDTHS = (480, 960, 1440)
+VARIANT_FORMATS = {'webp': 'WEBP', 'jpeg': 'JPEG'}
+PLACEHOLDER_WIDTH = 24
+PLACEHOLDER_OPTIONS = {'format': 'JPEG', 'quality': 40, 'blur': 2}
+
+_executor = None
+_in_flight = set()
+_lock = threading.Lock()
+
+
+def _pool():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.THUMBNAIL_WORKERS,
+                thread_name_prefix='thumbnails'
+            )
+        return _executor
+
+
+def _geometry(width):
+    return f'{width}x{round(width * CARD_HEIGHT / CARD_WIDTH)}'
+
+
+def image_key(name):
+    return f'post_image:{name}'
+
+
+def ready_image(image):
+    """Готовые варианты картинки поста или None.
+
+    В отличие от тега {% thumbnail %} никогда не декодирует картинку:
+    если вариантов ещё нет, ставит их генерацию в фон и сразу выходит.
+    """
+    if not image:
+        return None
+    variants = cache.get(image_key(image.name))
+    if variants is None:
+        schedule_image(image.name)
+    return variants
+
+
+def _placeholder(name):
+    """Крошечная размытая копия картинки в виде data URI."""
+    thumbnail = get_thumbnail(
+        name, _geometry(PLACEHOLDER_WIDTH), **CARD_OPTIONS,
+        **PLACEHOLDER_OPTIONS
+    )
+    with thumbnail.storage.open(thumbnail.name) as file:
+        data = base64.b64encode(file.read()).decode()
+    return f'data:image/jpeg;base64,{data}'
+
+
+def build_variants(name):
+    """Генерирует все варианты картинки и описание для шаблона."""
+    variants = {
+        'width': CARD_WIDTH,
+        'height': CARD_HEIGHT,
+        'placeholder': _placeholder(name),
+    }
+    for key, format_ in VARIANT_FORMATS.items():
+        srcset = []
+        for width in VARIANT_WIDTHS:
+            thumbnail = get_thumbnail(
+                name, _geometry(width), format=format_, **CARD_OPTIONS)
+            srcset.append(f'{thumbnail.url} {width}w')
+            if format_ == 'JPEG' and width == CARD_WIDTH:
+                variants['src'] = thumbnail.url
+        variants[f'{key}_srcset'] = ', '.join(srcset)
+    return variants
+
+
+def generate_image(name):
+    start = time.perf_counter()
+    try:
+        variants = build_variants(name)
+        metrics.observe(
+            'yatube_thumbnail_seconds', time.perf_counter() - start)
+    except Exception:
+        logger.exception('Не удалось создать варианты картинки %s', name)
+    else:
+        cache.set(image_key(name), variants, None)
+        # Страницы с заглушкой вместо картинки больше не актуальны.
+        bump_content_version()
+    finally:
+        with _lock:
+            _in_flight.discard(name)
+
+
+def _work(name):
+    try:
+        generate_image(name)
+    finally:
+        # У потока пула своё соединение с БД (kvstore sorl).
+        connection.close()
+
+
+def schedule_image(name):
+    """Ставит генерацию вариантов картинки в пул после коммита."""
+    def submit():
+        with _lock:
+            if name in _in_flight:
+                return
+            _in_flight.add(name)
+        # Потоки пула не могут писать в SQLite в памяти (тестовая база)
+        # параллельно с запросом: такая база генерирует прямо в запросе.
+        shared_db = not (connection.vendor == 'sqlite'
+                         and connection.is_in_memory_db())
+        if settings.THUMBNAIL_WORKERS and shared_db:
+            _pool().submit(_work, name)
+        else:
+            generate_image(name)
+
+    transaction.on_commit(submit)
@@ -0,0 +1,88 @@
+import warnings
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.uploadhandler import (StopUpload,
+                                             TemporaryFileUploadHandler)
+from django.template.defaultfilters import filesizeformat
+from PIL import Image
+
+# Форматы, которые Pillow называет по-своему, хотя это те же файлы:
+# MPO — JPEG с камер телефонов с дополнительными кадрами.
+FORMAT_ALIASES = {'MPO': 'JPEG'}
+
+
+class BoundedUploadHandler(TemporaryFileUploadHandler):
+    """Пишет загрузку во временный файл кусками по chunk_size байт.
+
+    Файл никогда не собирается в памяти целиком. Как только загрузка
+    превышает POST_IMAGE_MAX_BYTES, разбор запроса останавливается без
+    дочитывания тела, а имя поля запоминается в request.oversized_upload:
+    по нему форма отклоняет файл до записи поста.
+    """
+
+    def receive_data_chunk(self, raw_data, start):
+        if start + len(raw_data) > settings.POST_IMAGE_MAX_BYTES:
+            self.request.oversized_upload = self.field_name
+            raise StopUpload(connection_reset=True)
+        return super().receive_data_chunk(raw_data, start)
+
+
+def oversized_upload(request):
+    """Имя поля, загрузку которого оборвал BoundedUploadHandler."""
+    return getattr(request, 'oversized_upload', None)
+
+
+def too_large_error():
+    return ValidationError(
+        'Файл больше %(limit)s.', code='too_large',
+        params={'limit': filesizeformat(settings.POST_IMAGE_MAX_BYTES)},
+    )
+
+
+def check_image_header(file):
+    """Проверяет загруженную картинку, не декодируя пиксели.
+
+    Размер файла, формат, размеры и защита от «декомпрессионных бомб»
+    определяются по тому, что Image.open() читает из начала файла.
+    """
+    if file.size > settings.POST_IMAGE_MAX_BYTES:
+        raise too_large_error()
+    if hasattr(file, 'temporary_file_path'):
+        source = file.temporary_file_path()
+    else:
+        source = file
+        file.seek(0)
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter('error', Image.DecompressionBombWarning)
+            with Image.open(source) as image:
+                image_format, (width, height) = image.format, image.size
+    except (Image.DecompressionBombWarning,
+            Image.DecompressionBombError) as exc:
+        raise ValidationError(
+            'Картинка слишком большая для обработки.',
+            code='decompression_bomb',
+        ) from exc
+    except Exception as exc:
+        raise ValidationError(
+            'Загрузите правильное изображение.', code='invalid_image',
+        ) from exc
+    finally:
+        if hasattr(file, 'seek'):
+            file.seek(0)
+    image_format = FORMAT_ALIASES.get(image_format, image_format)
+    formats = settings.POST_IMAGE_FORMATS
+    if image_format not in formats:
+        raise ValidationError(
+            'Поддерживаются только форматы %(formats)s.', code='bad_format',
+            params={'formats': ', '.join(formats)},
+        )
+    if width * height > settings.POST_IMAGE_MAX_PIXELS:
+        raise ValidationError(
+            'Картинка %(width)s×%(height)s слишком большая, '
+            'допустимо не более %(limit)s пикселей.',
+            code='too_many_pixels',
+            params={'width': width, 'height': height,
+                    'limit': settings.POST_IMAGE_MAX_PIXELS},
+        )
@@ -1,6 +1,6 @@
 from django.urls import path
 
-from . import views
+from . import api, views
 
 app_name = 'posts'
 urlpatterns = [
@@ -14,9 +14,15 @@ urlpatterns = [
     path('profile/<str:username>/', views.profile,
          name='profile'
          ),
+    path('search/', views.search,
+         name='search'
+         ),
     path('posts/<int:post_id>/', views.post_detail,
          name='post_detail'
          ),
+    path('posts/<int:post_id>/comments/', views.post_comments,
+         name='post_comments'
+         ),
     # Доступно авторизованному пользователю
     path('create/', views.post_create,
          name='create_post'
@@ -33,6 +39,25 @@ urlpatterns = [
     path('profile/<str:username>/unfollow/', views.profile_unfollow,
          name='profile_unfollow'
          ),
+    # API только для чтения
+    path('api/posts/', api.index,
+         name='api_index'
+         ),
+    path('api/posts/batch/', api.posts_batch,
+         name='api_posts_batch'
+         ),
+    path('api/posts/<int:post_id>/', api.post_detail,
+         name='api_post_detail'
+         ),
+    path('api/posts/<int:post_id>/comments/', api.post_comments,
+         name='api_post_comments'
+         ),
+    path('api/group/<slug:slug>/', api.group_posts,
+         name='api_group_list'
+         ),
+    path('api/profile/<str:username>/', api.profile,
+         name='api_profile'
+         ),
     # Доступно автору
     path('posts/<post_id>/edit/', views.post_edit,
          name='post_edit'
@@ -1,8 +1,185 @@
-from django.core.paginator import Paginator
+import base64
+import binascii
+from datetime import datetime
 
+from django.conf import settings
+from django.core.paginator import Page, Paginator
+from django.db.models import Q
+from django.utils.functional import cached_property
 
-def paginator(posts, request, post_count):
-    paginator = Paginator(posts, post_count)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
-    return page_obj
+from .counters import cached_count
+
+
+def encode_cursor(key, pk):
+    """Упаковывает позицию (ключ сортировки, id) в непрозрачный токен.
+
+    Ключ — дата публикации либо число, например ранг поиска."""
+    key = key.isoformat() if isinstance(key, datetime) else repr(key)
+    raw = f'{key}|{pk}'.encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+# Разбор ключа курсора по типу поля сортировки: токен с ключом
+# другого типа считается битым.
+KEY_PARSERS = {
+    datetime: datetime.fromisoformat,
+    float: float,
+}
+
+
+def decode_cursor(token, key_type=datetime):
+    """Распаковывает токен курсора с ключом типа key_type,
+    для битого токена возвращает None."""
+    if not token:
+        return None
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        raw = base64.urlsafe_b64decode(padded.encode()).decode()
+        key, pk = raw.rsplit('|', 1)
+        return KEY_PARSERS[key_type](key), int(pk)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        return None
+
+
+def row_value(row, field):
+    """Поле строки выборки: модели или словаря из .values()."""
+    if isinstance(row, dict):
+        return row[field]
+    return getattr(row, field)
+
+
+class KeysetPaginator(Paginator):
+    """Постраничный вывод по курсору (-key_field, -id), по умолчанию
+    key_field — pub_date; key_type — тип его значений в курсоре.
+
+    Не выполняет ни COUNT(*), ни OFFSET: каждая страница — это выборка
+    per_page + 1 строк после (или до) позиции из токена ?after= (?before=).
+    Номер страницы и число страниц известны только относительно текущей:
+    этого достаточно для ссылок «Предыдущая»/«Следующая» в шаблоне.
+    """
+    keyset = True
+
+    def __init__(self, object_list, per_page,
+                 key_field='pub_date', id_field='id', key_type=datetime):
+        super().__init__(object_list, per_page)
+        self.key_field = key_field
+        self.key_type = key_type
+        self.id_field = id_field
+        self.next_cursor = None
+        self.previous_cursor = None
+        self._num_pages = 1
+
+    @property
+    def num_pages(self):
+        return self._num_pages
+
+    def _older_than(self, cursor):
+        key, pk = cursor
+        return (
+            Q(**{f'{self.key_field}__lt': key})
+            | Q(**{self.key_field: key, f'{self.id_field}__lt': pk})
+        )
+
+    def _newer_than(self, cursor):
+        key, pk = cursor
+        return (
+            Q(**{f'{self.key_field}__gt': key})
+            | Q(**{self.key_field: key, f'{self.id_field}__gt': pk})
+        )
+
+    def _cursor_of(self, row):
+        return encode_cursor(
+            row_value(row, self.key_field), row_value(row, self.id_field)
+        )
+
+    def _fetch_before(self, cursor):
+        queryset = self.object_list.filter(self._newer_than(cursor))
+        rows = list(queryset.order_by(
+            self.key_field, self.id_field)[:self.per_page + 1])
+        has_previous = len(rows) > self.per_page
+        return rows[:self.per_page][::-1], has_previous
+
+    def _fetch_after(self, cursor):
+        queryset = self.object_list
+        if cursor is not None:
+            queryset = queryset.filter(self._older_than(cursor))
+        rows = list(queryset.order_by(
+            f'-{self.key_field}', f'-{self.id_field}')[:self.per_page + 1])
+        has_next = len(rows) > self.per_page
+        return rows[:self.per_page], has_next
+
+    def get_page(self, after=None, before=None):
+        """Возвращает страницу после курсора after или до курсора before."""
+        after_cursor = decode_cursor(after, self.key_type)
+        before_cursor = (None if after_cursor
+                         else decode_cursor(before, self.key_type))
+        rows = []
+        if before_cursor is not None:
+            rows, has_previous = self._fetch_before(before_cursor)
+            has_next = True
+        if not rows:
+            rows, has_next = self._fetch_after(after_cursor)
+            has_previous = after_cursor is not None
+        if rows and has_next:
+            self.next_cursor = self._cursor_of(rows[-1])
+        if rows and has_previous:
+            self.previous_cursor = self._cursor_of(rows[0])
+        number = 2 if has_previous else 1
+        self._num_pages = number + 1 if has_next else number
+        return Page(rows, number, self)
+
+
+class CountedPaginator(Paginator):
+    """Paginator, берущий число объектов из функции count,
+    например из кэша, а не из COUNT(*) при каждом запросе."""
+
+    def __init__(self, object_list, per_page, count=None):
+        super().__init__(object_list, per_page)
+        self._count = count
+
+    @cached_property
+    def count(self):
+        if self._count is None:
+            return super().count
+        return self._count()
+
+
+def elided_page_range(paginator, number, on_each_side=2, on_ends=1):
+    """Номера страниц вокруг текущей и по краям, пропуски — None.
+    Как Paginator.get_elided_page_range из Django 3.2."""
+    num_pages = paginator.num_pages
+    if num_pages <= (on_each_side + on_ends + 1) * 2:
+        return list(paginator.page_range)
+    pages = []
+    if number > on_each_side + on_ends + 2:
+        pages.extend(range(1, on_ends + 1))
+        pages.append(None)
+        pages.extend(range(number - on_each_side, number + 1))
+    else:
+        pages.extend(range(1, number + 1))
+    if number < num_pages - on_each_side - on_ends - 1:
+        pages.extend(range(number + 1, number + on_each_side + 1))
+        pages.append(None)
+        pages.extend(range(num_pages - on_ends + 1, num_pages + 1))
+    else:
+        pages.extend(range(number + 1, num_pages + 1))
+    return pages
+
+
+def paginator(posts, request, post_count, key_field='pub_date',
+              id_field='id', key_type=datetime, count_scope=None):
+    """Страница постов в режиме settings.POSTS_PAGINATION. count_scope —
+    область кэшированного числа постов для режима 'offset'."""
+    if settings.POSTS_PAGINATION == 'offset':
+        count = None
+        if count_scope is not None:
+            count = cached_count(count_scope, posts)
+        paginator = CountedPaginator(posts, post_count, count)
+        page_number = request.GET.get('page')
+        return paginator.get_page(page_number)
+    paginator = KeysetPaginator(
+        posts, post_count, key_field=key_field, id_field=id_field,
+        key_type=key_type)
+    return paginator.get_page(
+        request.GET.get('after'), request.GET.get('before')
+    )
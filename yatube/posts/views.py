@@ -1,28 +1,38 @@
 from django.contrib.auth.decorators import login_required
 from django.shortcuts import get_object_or_404, redirect, render
-from django.views.decorators.cache import cache_page
 
+from . import objects
+from .caching import conditional_page, versioned_cache_page
+from .comments import comment_batch
+from .feed import follow_page
 from .forms import CommentForm, PostForm
-from .models import Follow, Group, Post, User
+from .models import Follow, Post
+from .search import search_posts
+from .uploads import oversized_upload
 from .utils import paginator
 
 POST_COUNT: int = 10
+COMMENT_COUNT: int = 20
 
 
-@cache_page(20, key_prefix='index_page')
+@conditional_page('index_page')
+@versioned_cache_page('index_page')
 def index(request):
-    posts = Post.objects.all()
-    page_obj = paginator(posts, request, POST_COUNT)
+    posts = Post.objects.for_cards()
+    page_obj = paginator(posts, request, POST_COUNT, count_scope='all')
     context = {
         'page_obj': page_obj,
     }
     return render(request, 'posts/index.html', context)
 
 
+@conditional_page('group_page')
+@versioned_cache_page('group_page')
 def group_posts(request, slug):
-    group = get_object_or_404(Group, slug=slug)
-    posts = group.posts.all()  # type: ignore
-    page_obj = paginator(posts, request, POST_COUNT)
+    group = objects.group_or_404(request, slug)
+    posts = group.posts.for_cards()  # type: ignore
+    page_obj = paginator(
+        posts, request, POST_COUNT, count_scope=f'group:{group.pk}')
     context = {
         'group': group,
         'page_obj': page_obj,
@@ -30,10 +40,13 @@ def group_posts(request, slug):
     return render(request, 'posts/group_list.html', context)
 
 
+@conditional_page('profile_page')
+@versioned_cache_page('profile_page')
 def profile(request, username):
-    author = get_object_or_404(User, username=username)
-    posts = author.posts.all()  # type: ignore
-    page_obj = paginator(posts, request, POST_COUNT)
+    author = objects.user_or_404(request, username)
+    posts = author.posts.for_cards()  # type: ignore
+    page_obj = paginator(
+        posts, request, POST_COUNT, count_scope=f'author:{author.pk}')
     follow = Follow.objects.filter(author=author)
     following = follow.exists() and request.user.is_authenticated
     context = {
@@ -44,19 +57,55 @@ def profile(request, username):
     return render(request, 'posts/profile.html', context)
 
 
+def search(request):
+    query = request.GET.get('q', '').strip()
+    posts = search_posts(query, Post.objects.for_cards())
+    page_obj = paginator(posts, request, POST_COUNT,
+                         key_field='score', key_type=float)
+    context = {
+        'query': query,
+        'page_obj': page_obj,
+    }
+    return render(request, 'posts/search.html', context)
+
+
+@conditional_page('post_page')
 def post_detail(request, post_id):
-    post = get_object_or_404(Post, pk=post_id)
+    post = objects.post_or_404(request, post_id)
     form = CommentForm()
+    comments, next_cursor = comment_batch(
+        post.comments.select_related('author'), COMMENT_COUNT,
+        request.GET.get('after'))
     context = {
         'post': post,
         'form': form,
+        'comments': comments,
+        'next_cursor': next_cursor,
     }
     return render(request, 'posts/post_detail.html', context)
 
 
+def post_comments(request, post_id):
+    """Следующая пачка комментариев поста фрагментом HTML."""
+    post = get_object_or_404(Post.objects.only('id'), pk=post_id)
+    comments, next_cursor = comment_batch(
+        post.comments.select_related('author'), COMMENT_COUNT,
+        request.GET.get('after'))
+    context = {
+        'post': post,
+        'comments': comments,
+        'next_cursor': next_cursor,
+    }
+    return render(request, 'posts/includes/comment_list.html', context)
+
+
 @login_required
 def post_create(request):
-    form = PostForm(request.POST or None, files=request.FILES or None)
+    form = PostForm(
+        request.POST or None,
+        files=request.FILES or None,
+        oversized_upload=oversized_upload(request)
+    )
     if form.is_valid():
         new_post = form.save(commit=False)
         new_post.author = request.user
@@ -67,12 +116,13 @@ def post_create(request):
 
 @login_required
 def post_edit(request, post_id):
-    post = get_object_or_404(Post, id=post_id)
+    post = objects.post_or_404(request, post_id)
     if request.user != post.author:
         return redirect('posts:post_detail', post_id)
     form = PostForm(
         request.POST or None,
         files=request.FILES or None,
+        oversized_upload=oversized_upload(request),
         instance=post
     )
     if form.is_valid():
@@ -104,8 +154,7 @@ def post_delete(request, post_id):
 
 @login_required
 def follow_index(request):
-    posts = Post.objects.filter(author__following__user=request.user).all()
-    page_obj = paginator(posts, request, POST_COUNT)
+    page_obj = follow_page(request, POST_COUNT)
     context = {
         'page_obj': page_obj,
     }
@@ -114,7 +163,7 @@ def follow_index(request):
 
 @login_required
 def profile_follow(request, username):
-    author = get_object_or_404(User, username=username)
+    author = objects.user_or_404(request, username)
     follow = Follow.objects.filter(user=request.user, author=author).exists()
     if not follow and username != request.user.username:
         Follow.objects.create(user=request.user, author=author)
@@ -123,7 +172,7 @@ def profile_follow(request, username):
 
 @login_required
 def profile_unfollow(request, username):
-    author = get_object_or_404(User, username=username)
+    author = objects.user_or_404(request, username)
     query = Follow.objects.filter(user=request.user, author=author)
     if query.exists():
         query.delete()
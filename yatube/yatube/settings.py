@@ -41,6 +41,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.MetricsMiddleware',
+    'core.middleware.ServerTimingMiddleware',
+    'core.middleware.ProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -144,11 +147,155 @@ CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Тесты работают с кэшем во временном каталоге (core.testing).
+
+TEST_RUNNER = 'core.testing.IsolatedCacheRunner'
+
 
 # Caches
 
+# Общий для воркеров и management-команд каталог второго уровня кэша:
+# через него расходятся страницы и сбросы. Пустой YATUBE_CACHE_DIR —
+# у каждого процесса свой временный каталог, как у LocMemCache.
+
+CACHE_DIR = os.environ.get(
+    'YATUBE_CACHE_DIR', os.path.join(BASE_DIR, 'cache'))
+
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'BACKEND': 'core.cache.MeteredTwoTierCache',
+        'LOCATION': CACHE_DIR,
+        'OPTIONS': {
+            'L1_MAX_ENTRIES': 1000,
+            'L1_TIMEOUT': 60,
+            'MAX_ENTRIES': 100_000,
+        },
     }
 }
+
+# Страницы сбрасываются сменой поколения контента при записи,
+# поэтому таймаут нужен лишь для вытеснения старых поколений.
+
+PAGE_CACHE_TIMEOUT = 60 * 60 * 4
+
+# Защита от лавины пересчётов (core.stampede): сколько после истечения
+# отдавать устаревшее значение, пока его пересчитывает один запрос,
+# на сколько берётся блокировка пересчёта, сколько ждать чужого
+# пересчёта без устаревшего значения и коэффициент раннего обновления
+# (0 — не обновлять заранее).
+
+STAMPEDE_STALE_TIMEOUT = 60 * 5
+STAMPEDE_LOCK_TIMEOUT = 30
+STAMPEDE_WAIT = 2
+STAMPEDE_BETA = 1.0
+
+# Кэш постов, групп и пользователей для поиска по id, slug и username
+# (posts.objects); сбрасывается сигналами при записи.
+
+OBJECT_CACHE_TIMEOUT = 60 * 60
+
+# Сколько помнить, что поста, группы или пользователя нет, и сколько
+# хранить отрисованную страницу 404 для посетителей без сессии.
+
+MISSING_CACHE_TIMEOUT = 60
+NOT_FOUND_CACHE_TIMEOUT = 60 * 10
+
+
+# Pagination
+# 'keyset' — курсорные ссылки ?after=/?before= без COUNT и OFFSET,
+# 'offset' — классический Paginator с номерами страниц ?page=.
+
+POSTS_PAGINATION = 'keyset'
+
+# В режиме 'offset' число постов области (все, группа, автор, лента)
+# берётся из кэша и сбрасывается при записи; счётчик ленты вдобавок
+# живёт не дольше FEED_COUNT_TIMEOUT секунд.
+
+POST_COUNT_TIMEOUT = 60 * 60 * 24
+FEED_COUNT_TIMEOUT = 60
+
+
+# Follow feed
+# Сколько записей ленты создаётся одним INSERT при раскладке поста
+# по подписчикам и при заполнении ленты после подписки.
+
+FEED_FANOUT_BATCH = 1000
+
+# Режим ленты подписок: 'write' — таблица FeedEntry, 'read' — слияние
+# кэшированных списков последних постов авторов, 'join' — JOIN Follow/Post.
+
+FOLLOW_FEED_MODE = 'write'
+
+# Длина кэшированного списка последних постов автора для режима 'read'.
+
+FEED_RECENT_POSTS = 200
+
+FEED_CACHE_TIMEOUT = 60 * 60 * 24
+
+
+# Thumbnails
+# Число потоков, генерирующих миниатюры в фоне; 0 — прямо в запросе.
+
+THUMBNAIL_WORKERS = 2
+
+
+# Uploads
+# Загрузки всегда пишутся во временный файл кусками по 64 КБ; картинки
+# постов проверяются по заголовку до декодирования.
+
+FILE_UPLOAD_HANDLERS = ['posts.uploads.BoundedUploadHandler']
+
+POST_IMAGE_MAX_BYTES = 10 * 1024 * 1024
+
+POST_IMAGE_MAX_PIXELS = 40_000_000
+
+POST_IMAGE_FORMATS = ('JPEG', 'PNG', 'GIF', 'WEBP')
+
+
+# Query plan audit
+# Известные находки команды audit_queries; новые считаются регрессией.
+
+QUERY_AUDIT_BASELINE = os.path.join(BASE_DIR, 'posts', 'query_plans.json')
+
+
+# Metrics
+# Каталог, куда каждый воркер раз в METRICS_FLUSH_INTERVAL секунд
+# сохраняет свои метрики; /metrics суммирует все файлы. Без каталога
+# /metrics показывает только метрики обслужившего его процесса.
+
+METRICS_DIR = None
+
+METRICS_FLUSH_INTERVAL = 1
+
+# /metrics отдаётся только с этих адресов или по заголовку
+# Authorization: Bearer <METRICS_TOKEN> (bearer_token в настройках
+# сборщика Prometheus); остальным — 403. За обратным прокси все запросы
+# приходят с его адреса, поэтому по умолчанию список пуст.
+
+METRICS_ALLOWED_IPS = ()
+
+METRICS_TOKEN = os.environ.get('YATUBE_METRICS_TOKEN')
+
+
+# Server-Timing
+# Заголовок с разбивкой времени ответа на SQL, шаблоны и миниатюры.
+
+SERVER_TIMING = False
+
+
+# Profiling
+# Доля запросов, стеки которых снимаются раз в PROFILING_INTERVAL секунд;
+# имена URL или вьюх, которые профилируются всегда; заголовок, которым
+# сотрудник включает профилирование своего запроса.
+
+PROFILING_RATE = 0
+
+PROFILING_VIEWS = ()
+
+PROFILING_HEADER = 'HTTP_X_PROFILE'
+
+PROFILING_INTERVAL = 0.005
+
+PROFILING_DIR = os.path.join(BASE_DIR, 'profiles')
+
+PROFILING_KEEP = 20
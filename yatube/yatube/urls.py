@@ -1,3 +1,4 @@
+from core.views import profile_file, profiles, prometheus_metrics
 from django.conf import settings
 from django.conf.urls import handler403, handler404, handler500
 from django.conf.urls.static import static
@@ -10,10 +11,14 @@ handler403 = 'core.views.permission_denied'
 
 urlpatterns = [
     path('auth/', include('users.urls')),
+    path('admin/profiles/', profiles, name='profiles'),
+    path('admin/profiles/<str:label>/<str:name>', profile_file,
+         name='profile_file'),
     path('admin/', admin.site.urls),
     path('', include('posts.urls', namespace='posts')),
     path('auth/', include('django.contrib.auth.urls')),
     path('about/', include('about.urls', namespace='about')),
+    path('metrics', prometheus_metrics, name='metrics'),
 ]
 
 if settings.DEBUG: